@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmarks of gcparser.
+
+Usage:
+    python3 -m benchmark png [--width W] [--height H] [--count N]
+    python3 -m benchmark parsers [--count N] [--scale S] [--only NAME]
+                                 [--save FILE] [--baseline FILE] [--tolerance T]
+                                 [--profile]
+    python3 -m benchmark pipeline [--listings N] [--seek-total N] [--workers W]
+                                  [--latency L] [--error-rate E] [--logout-rate R]
+                                  [--no-pacing]
+
+"""
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import json
+import logging
+from random import Random
+import struct
+import sys
+import threading
+from time import perf_counter
+import tracemalloc
+import zlib
+
+import fixtures
+import gcparser
+
+
+############################################################
+### PNG decoding.                                        ###
+############################################################
+
+def _png_chunk(chunk_type, data):
+    """ Return PNG chunk with length and CRC. """
+    return struct.pack(">I", len(data)) + chunk_type + data + struct.pack(">I", zlib.crc32(chunk_type + data))
+
+
+def _paeth(a, b, c):
+    p = a + b - c
+    pa = abs(p - a)
+    pb = abs(p - b)
+    pc = abs(p - c)
+    if pa <= pb and pa <= pc:
+        return a
+    elif pb <= pc:
+        return b
+    return c
+
+
+def encode_png(width, height, data, filter_type=0):
+    """
+    Encode RGBA8 data as PNG image.
+
+    Arguments:
+        width       --- Width of the image.
+        height      --- Height of the image.
+        data        --- RGBA8 pixel data.
+
+    Keyworded arguments:
+        filter_type --- PNG filter type used for all scanlines.
+
+    """
+    stride = width * 4
+    prev = bytes(stride)
+    scanlines = []
+    for y in range(height):
+        row = data[y*stride:(y+1)*stride]
+        filtered = bytearray(stride)
+        for i in range(stride):
+            a = row[i-4] if i >= 4 else 0
+            b = prev[i]
+            c = prev[i-4] if i >= 4 else 0
+            predictor = (0, a, b, (a + b) >> 1, _paeth(a, b, c))[filter_type]
+            filtered[i] = (row[i] - predictor) & 0xFF
+        scanlines.append(bytes([filter_type]) + bytes(filtered))
+        prev = row
+    header = struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + _png_chunk(b"IHDR", header) + _png_chunk(b"IDAT", zlib.compress(b"".join(scanlines))) + _png_chunk(b"IEND", b"")
+
+
+def glyph_data(width, height, seed=0):
+    """ Generate RGBA8 data resembling text on transparent background. """
+    random = Random(seed)
+    data = bytearray(width * height * 4)
+    for y in range(height):
+        for x in range(width):
+            if (x // 3 + y // 4 + random.randint(0, 2)) % 4 == 0:
+                data[(y*width+x)*4:(y*width+x+1)*4] = b"\x20\x20\x20\xff"
+    return data
+
+
+def bench_png(args):
+    """ Measure decode throughput of Image.from_data. """
+    width = args.width
+    height = args.height
+    print("PNG decoding {0}x{1} RGBA8, {2} images per filter type:".format(width, height, args.count))
+    for filter_type, name in enumerate(("None", "Sub", "Up", "Average", "Paeth")):
+        data = encode_png(width, height, glyph_data(width, height, filter_type), filter_type)
+        start = perf_counter()
+        for i in range(args.count):
+            gcparser.Image.from_data(data)
+        elapsed = perf_counter() - start
+        megapixels = width * height * args.count / 1e6
+        print("    {0:<8} {1:10.1f} images/s {2:8.2f} Mpx/s".format(name, args.count / elapsed, megapixels / elapsed))
+
+
+
+############################################################
+### Parser fixtures.                                     ###
+############################################################
+
+def parser_fixtures(scale=1):
+    """
+    Return list of (name, parser factory, call, page) fixtures for parser benchmarks.
+
+    Keyworded arguments:
+        scale       --- Multiplier of the size of scaled fixtures.
+
+    """
+    result = []
+    result.append(("listing", gcparser.CacheDetails, lambda parser: parser.get("GC1A2B3"), fixtures.listing_page()))
+    result.append(("listing-pm", gcparser.CacheDetails, lambda parser: parser.get("GC1A2B3"), fixtures.pm_listing_page()))
+    result.append(("listing-logs-{0}".format(1000 * scale), gcparser.CacheDetails, lambda parser: parser.get("GC1A2B3"), fixtures.listing_page(logs=1000 * scale)))
+    result.append(("seek-{0}".format(20 * scale), gcparser.SeekCache, lambda parser: parser.get("http://www.geocaching.com/seek/nearest.aspx"), fixtures.seek_page(rows=20 * scale)))
+    result.append(("mylogs-{0}".format(2000 * scale), gcparser.MyGeocachingLogs, lambda parser: parser.get(), fixtures.my_logs_page(rows=2000 * scale)))
+    return result
+
+
+class StubSession:
+    """ Session returning the same page for every request. """
+
+    archive = None
+    metrics = None
+
+    def __init__(self, page):
+        self.page = page
+        self.requests = 0
+
+    def request(self, url, auth=False, data=None, check=True, raw=False):
+        self.requests += 1
+        if raw:
+            return self.page
+        return self.page.decode("utf-8")
+
+
+def _percentile(values, percent):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+def bench_parsers(args):
+    """ Measure throughput, latency and peak memory of parsers on fixture pages. """
+    logging.getLogger("gcparser").setLevel(logging.ERROR)
+    results = {}
+    profiles = []
+    print("{0:<20} {1:>9} {2:>10} {3:>9} {4:>9} {5:>9} {6:>10}".format("Fixture", "Size KB", "pages/s", "p50 ms", "p90 ms", "p99 ms", "peak KB"))
+    for name, factory, call, page in parser_fixtures(args.scale):
+        if args.only and not any(part in name for part in args.only):
+            continue
+        session = StubSession(page)
+        parser = factory(session=session)
+        call(parser)
+        latencies = []
+        for i in range(args.count):
+            start = perf_counter()
+            call(parser)
+            latencies.append(perf_counter() - start)
+        tracemalloc.start()
+        call(parser)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        if args.profile:
+            profiler = gcparser.ParseProfiler()
+            with profiler:
+                call(parser)
+            profiles.append((name, profiler.report(10)))
+        result = {"size":len(page), "throughput":len(latencies) / sum(latencies), "p50":_percentile(latencies, 50), "p90":_percentile(latencies, 90), "p99":_percentile(latencies, 99), "peak":peak}
+        results[name] = result
+        print("{0:<20} {1:9.1f} {2:10.1f} {3:9.2f} {4:9.2f} {5:9.2f} {6:10.1f}".format(name, result["size"] / 1024, result["throughput"], result["p50"] * 1000, result["p90"] * 1000, result["p99"] * 1000, result["peak"] / 1024))
+    for name, report in profiles:
+        print()
+        print("Profile of {0}:".format(name))
+        print(report)
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as fp:
+            json.dump(results, fp, indent=2, sort_keys=True)
+        print("Results saved to '{0}'.".format(args.save))
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as fp:
+            baseline = json.load(fp)
+        regressions = 0
+        print("Comparison with '{0}' (tolerance {1:.0%}):".format(args.baseline, args.tolerance))
+        for name, result in sorted(results.items()):
+            if name not in baseline:
+                print("    {0:<20} not in baseline".format(name))
+                continue
+            for key in ("p50", "p90", "peak"):
+                change = result[key] / baseline[name][key] - 1 if baseline[name][key] else 0
+                flag = ""
+                if change > args.tolerance:
+                    flag = "  REGRESSION"
+                    regressions += 1
+                print("    {0:<20} {1:<5} {2:+7.1%}{3}".format(name, key, change, flag))
+        if regressions:
+            sys.exit(1)
+
+
+
+############################################################
+### Pipeline.                                            ###
+############################################################
+
+def bench_pipeline(args):
+    """ Measure throughput of HTTPSession and parsers against FakeGeocaching server. """
+    import fakeserver
+    logging.getLogger("gcparser").setLevel(logging.ERROR)
+    server = fakeserver.FakeGeocaching(latency=args.latency, jitter=args.latency, error_rate=args.error_rate, logout_rate=args.logout_rate, seek_total=args.seek_total)
+    with server:
+        session = gcparser.HTTPSession(gcparser.Credentials("benchmark", "benchmark"))
+        session.base_url = server.base_url
+        session.metrics = gcparser.MetricsRegistry()
+        session.retry_policy = gcparser.RetryPolicy(timeout=10, max_attempts=10, backoff=0.05, max_backoff=1)
+        if args.no_pacing:
+            session.wait = lambda auth: None
+        print("Pipeline against {0}, {1} workers:".format(server.base_url, args.workers))
+
+        start = perf_counter()
+        details = CacheDetailsJob(session)
+        with ThreadPoolExecutor(args.workers) as executor:
+            listings = list(executor.map(details, ("GC{0:05X}".format(i) for i in range(args.listings))))
+        elapsed = perf_counter() - start
+        print("    {0:<10} {1:6d} pages {2:8.2f} s {3:8.1f} pages/s".format("listings", len(listings), elapsed, len(listings) / elapsed))
+
+        start = perf_counter()
+        result = gcparser.SeekCache(session=session).get("http://www.geocaching.com/seek/nearest.aspx?origin_lat=50&origin_long=14&dist=10")
+        caches = list(result)
+        elapsed = perf_counter() - start
+        pages = server.counters["/seek/nearest.aspx"]
+        print("    {0:<10} {1:6d} pages {2:8.2f} s {3:8.1f} pages/s, {4} caches".format("seek", pages, elapsed, pages / elapsed, len(caches)))
+    metrics = session.metrics.snapshot()
+    print("Client: {0}".format(", ".join("{0}={1:g}".format(name[9:-6], sum(metrics[name].values())) for name in ("gcparser_requests_total", "gcparser_retries_total", "gcparser_relogins_total", "gcparser_received_bytes_total"))))
+    wait = metrics["gcparser_wait_seconds"]
+    print("Waiting: {0:.2f} s in {1} waits".format(sum(value["sum"] for value in wait.values()), sum(value["count"] for value in wait.values())))
+    print("Server: {0}".format(", ".join("{0}={1}".format(key, value) for key, value in sorted(server.counters.items()) if not key.startswith("/"))))
+
+
+class CacheDetailsJob:
+    """ Download cache details by waypoint using a parser per thread. """
+
+    def __init__(self, session):
+        self.session = session
+        self._local = threading.local()
+
+    def __call__(self, waypoint):
+        if not hasattr(self._local, "parser"):
+            self._local.parser = gcparser.CacheDetails(session=self.session)
+        return self._local.parser.get(waypoint)
+
+
+
+############################################################
+### Command line.                                        ###
+############################################################
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks of gcparser.")
+    commands = parser.add_subparsers(dest="command")
+    png = commands.add_parser("png", help="PNG decoding throughput.")
+    png.add_argument("--width", type=int, default=55)
+    png.add_argument("--height", type=int, default=30)
+    png.add_argument("--count", type=int, default=200)
+    png.set_defaults(run=bench_png)
+    parsers = commands.add_parser("parsers", help="Parser throughput, latency and memory on synthetic pages.")
+    parsers.add_argument("--count", type=int, default=50)
+    parsers.add_argument("--scale", type=int, default=1, help="Multiplier of the size of scaled fixtures.")
+    parsers.add_argument("--only", action="append", help="Run only fixtures containing this string.")
+    parsers.add_argument("--save", help="Save results as JSON baseline.")
+    parsers.add_argument("--baseline", help="Compare results with JSON baseline.")
+    parsers.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown against baseline.")
+    parsers.add_argument("--profile", action="store_true", help="Print time spent on each pattern and field.")
+    parsers.set_defaults(run=bench_parsers)
+    pipeline = commands.add_parser("pipeline", help="Whole pipeline throughput against local fake server.")
+    pipeline.add_argument("--listings", type=int, default=10)
+    pipeline.add_argument("--seek-total", type=int, default=60)
+    pipeline.add_argument("--workers", type=int, default=4)
+    pipeline.add_argument("--latency", type=float, default=0.01, help="Server latency in seconds.")
+    pipeline.add_argument("--error-rate", type=float, default=0, help="Probability of server error.")
+    pipeline.add_argument("--logout-rate", type=float, default=0, help="Probability of login expiring.")
+    pipeline.add_argument("--no-pacing", action="store_true", help="Disable HTTPSession.wait pacing.")
+    pipeline.set_defaults(run=bench_pipeline)
+    args = parser.parse_args()
+    if args.command is None:
+        parser.error("No benchmark selected.")
+    args.run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Local stand-in for geocaching.com website serving synthetic pages.
+
+Serves cache listings, seek queries with __VIEWSTATE postback paging, the list
+of user's logs, profile and login pages.  Latency, server errors and expired
+logins can be simulated.  Point HTTPInterface.base_url (or HTTPSession.base_url)
+to FakeGeocaching.base_url to use it.
+
+Usage:
+    python3 -m fakeserver [--port P] [--latency L] [--error-rate E] [--logout-rate R]
+
+"""
+
+import argparse
+import base64
+from collections import defaultdict
+from functools import lru_cache
+import http.server
+import json
+from random import random
+import socketserver
+import threading
+from time import sleep
+import urllib.parse
+import zlib
+
+import fixtures
+
+
+__all__ = ["FakeGeocaching"]
+
+
+@lru_cache(maxsize=256)
+def _listing(waypoint, logs, pm_only):
+    if pm_only:
+        return fixtures.pm_listing_page(waypoint, seed=zlib.crc32(waypoint.encode("ascii")))
+    return fixtures.listing_page(waypoint, logs=logs, seed=zlib.crc32(waypoint.encode("ascii")))
+
+
+@lru_cache(maxsize=256)
+def _seek(page, rows, total):
+    viewstate = base64.b64encode(json.dumps({"page":page}).encode("ascii")).decode("ascii")
+    return fixtures.seek_page(rows, seed=page, total=total, viewstate=viewstate)
+
+
+@lru_cache(maxsize=4)
+def _my_logs(rows):
+    return fixtures.my_logs_page(rows)
+
+
+def _form_page(title, content=""):
+    viewstate = base64.b64encode(title.encode("utf-8")).decode("ascii")
+    return fixtures.page(title, '<input type="hidden" name="__VIEWSTATE" id="__VIEWSTATE" value="{0}" />\n{1}'.format(viewstate, content)).encode("utf-8")
+
+
+_logged_out_page = _form_page("Cache Details", '<p class="NotSignedInText">You are not logged in.</p>')
+
+
+class FakeGeocachingHandler(http.server.BaseHTTPRequestHandler):
+    """ Request handler of FakeGeocaching. """
+
+    server_version = "FakeGeocaching/1.0"
+
+    def do_GET(self):
+        self._handle(None)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        form = urllib.parse.parse_qs(self.rfile.read(length).decode("utf-8"), keep_blank_values=True)
+        self._handle(dict((key, values[0]) for key, values in form.items()))
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            http.server.BaseHTTPRequestHandler.log_message(self, format, *args)
+
+    def _handle(self, form):
+        server = self.server
+        parts = urllib.parse.urlsplit(self.path)
+        query = dict((key, values[0]) for key, values in urllib.parse.parse_qs(parts.query).items())
+        path = parts.path.lower()
+        server.count("requests")
+        server.count(path)
+        if server.latency or server.jitter:
+            sleep(server.latency + random() * server.jitter)
+        if random() < server.error_rate:
+            server.count("errors")
+            self._send(503, b"Service Unavailable")
+            return
+        route = self._routes.get(path)
+        if route is None:
+            self._send(404, b"Not Found")
+            return
+        route(self, query, form)
+
+    def _send(self, code, body, headers=()):
+        self.send_response(code)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _session(self):
+        """ Return id of valid login session, or None. """
+        for cookie in self.headers.get_all("Cookie", ()):
+            for item in cookie.split(";"):
+                name, _, value = item.strip().partition("=")
+                if name == "userid" and self.server.valid_session(value):
+                    return value
+        return None
+
+    def _signed_in(self):
+        """ Check login, send logged out page if needed. """
+        session = self._session()
+        if session is not None and random() < self.server.logout_rate:
+            self.server.expire(session)
+            session = None
+        if session is None:
+            self.server.count("logged_out")
+            self._send(200, _logged_out_page)
+            return False
+        return True
+
+    def _login(self, query, form):
+        if form is None:
+            self._send(200, _form_page("Geocaching > Log in"))
+            return
+        credentials = (form.get("ctl00$ContentBody$tbUsername"), form.get("ctl00$ContentBody$tbPassword"))
+        if None in credentials or (self.server.credentials is not None and credentials != tuple(self.server.credentials)):
+            self._send(200, _form_page("Geocaching > Log in", "<p>Invalid credentials.</p>"))
+            return
+        session = self.server.login()
+        self._send(200, _form_page("Geocaching > Welcome"), (("Set-Cookie", "userid={0}; Path=/".format(session)),))
+
+    def _cache_details(self, query, form):
+        if not self._signed_in():
+            return
+        waypoint = query.get("wp")
+        if waypoint is None:
+            waypoint = "GC{0:X}".format(zlib.crc32(query.get("guid", "").encode("ascii")) & 0xFFFFF)
+        waypoint = waypoint.upper()
+        self._send(200, _listing(waypoint, self.server.listing_logs, waypoint in self.server.pm_only))
+
+    def _nearest(self, query, form):
+        page = 0
+        if form is not None and form.get("__EVENTTARGET") == "ctl00$ContentBody$pgrTop$ctl08":
+            page = json.loads(base64.b64decode(form.get("__VIEWSTATE", "")).decode("ascii"))["page"] + 1
+        rows = max(0, min(self.server.seek_rows, self.server.seek_total - page * self.server.seek_rows))
+        self._send(200, _seek(page, rows, self.server.seek_total))
+
+    def _logs(self, query, form):
+        if not self._signed_in():
+            return
+        self._send(200, _my_logs(self.server.mylogs_rows))
+
+    def _profile(self, query, form):
+        if not self._signed_in():
+            return
+        self._send(200, _form_page("Edit Profile Details"))
+
+    _routes = {"/login/default.aspx":_login,
+               "/seek/cache_details.aspx":_cache_details,
+               "/seek/nearest.aspx":_nearest,
+               "/my/logs.aspx":_logs,
+               "/account/editprofiledetails.aspx":_profile}
+
+
+class FakeGeocaching(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    """
+    Threaded local HTTP server imitating geocaching.com website.
+
+    Attributes:
+        base_url    --- URL of the server for HTTPInterface.base_url.
+        latency     --- Minimal delay of every response in seconds.
+        jitter      --- Maximal random delay added to latency in seconds.
+        error_rate  --- Probability of '503 Service Unavailable' response.
+        logout_rate --- Probability of login session expiring on a request.
+        credentials --- Accepted (username, password), or None to accept any.
+        seek_total  --- Total count of caches found by seek queries.
+        seek_rows   --- Number of caches on one seek page.
+        listing_logs --- Number of logs in cache listings.
+        mylogs_rows --- Number of logs in the list of user's logs.
+        pm_only     --- Set of waypoints of PM only caches.
+        counters    --- Dictionary with counts of requests, errors, logins...
+
+    Methods:
+        start       --- Start serving in a background thread.
+        stop        --- Stop the server.
+
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address=("127.0.0.1", 0), latency=0, jitter=0, error_rate=0, logout_rate=0, credentials=None,
+                 seek_total=100, seek_rows=20, listing_logs=20, mylogs_rows=200, pm_only=(), verbose=False):
+        """
+        Keyworded arguments:
+            address     --- (host, port) to listen on, random port by default.
+            verbose     --- Log every request to stderr.
+
+        For the rest see class attributes.
+
+        """
+        http.server.HTTPServer.__init__(self, address, FakeGeocachingHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.logout_rate = logout_rate
+        self.credentials = credentials
+        self.seek_total = seek_total
+        self.seek_rows = seek_rows
+        self.listing_logs = listing_logs
+        self.mylogs_rows = mylogs_rows
+        self.pm_only = set(pm_only)
+        self.verbose = verbose
+        self.counters = defaultdict(int)
+        self._sessions = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return "http://{0}:{1}".format(*self.server_address[:2])
+
+    def count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def login(self):
+        """ Create new login session, return its id. """
+        with self._lock:
+            self.counters["logins"] += 1
+            session = str(self.counters["logins"])
+            self._sessions.add(session)
+        return session
+
+    def expire(self, session):
+        with self._lock:
+            self.counters["expired"] += 1
+            self._sessions.discard(session)
+
+    def valid_session(self, session):
+        with self._lock:
+            return session in self._sessions
+
+    def start(self):
+        """
+        Start serving in a background thread, return self.
+
+        """
+        self._thread = threading.Thread(target=self.serve_forever, name="FakeGeocaching")
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """
+        Stop the server.
+
+        """
+        if self._thread is not None:
+            self.shutdown()
+            self._thread.join()
+            self._thread = None
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for geocaching.com website.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0)
+    parser.add_argument("--jitter", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--logout-rate", type=float, default=0)
+    parser.add_argument("--seek-total", type=int, default=100)
+    parser.add_argument("--listing-logs", type=int, default=20)
+    parser.add_argument("--mylogs-rows", type=int, default=200)
+    args = parser.parse_args()
+    server = FakeGeocaching((args.host, args.port), latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, logout_rate=args.logout_rate,
+                            seek_total=args.seek_total, listing_logs=args.listing_logs, mylogs_rows=args.mylogs_rows, verbose=True)
+    print("Serving on {0}".format(server.base_url))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Synthetic geocaching.com pages shared by benchmark and fakeserver.
+
+"""
+
+import json
+from random import Random
+
+
+__all__ = ["page", "listing_page", "pm_listing_page", "seek_page", "my_logs_page"]
+
+
+_words = ("forest", "bridge", "castle", "river", "hill", "stone", "old", "mill", "chapel", "view", "Praha", "Brno", "kámen", "Čertova", "studánka")
+_countries = (("Hlavni mesto Praha", "Czech Republic"), ("Jihomoravsky kraj", "Czech Republic"), (None, "Slovakia"))
+_log_types = ("Found it", "Didn't find it", "Write note", "Webcam Photo Taken", "Attended")
+_months = ("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+
+
+def _guid(random):
+    return "{0:08x}-{1:04x}-{2:04x}-{3:04x}-{4:012x}".format(random.getrandbits(32), random.getrandbits(16), random.getrandbits(16), random.getrandbits(16), random.getrandbits(48))
+
+
+def _waypoint(random):
+    return "GC" + "".join(random.choice("0123456789ABCDEFGHJKMNPQRTVWXYZ") for i in range(5))
+
+
+def _text(random, words):
+    return " ".join(random.choice(_words) for i in range(words))
+
+
+def _hidden_inputs(random, viewstate=None):
+    if viewstate is None:
+        viewstate = "".join(random.choice("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/") for i in range(2000))
+    return ('<input type="hidden" name="__EVENTTARGET" id="__EVENTTARGET" value="" />\n'
+            '<input type="hidden" name="__EVENTARGUMENT" id="__EVENTARGUMENT" value="" />\n'
+            '<input type="hidden" name="__VIEWSTATE" id="__VIEWSTATE" value="{0}" />\n').format(viewstate)
+
+
+def page(title, body):
+    """
+    Wrap body into HTML page with the form of geocaching.com pages.
+
+    Arguments:
+        title       --- Title of the page.
+        body        --- HTML content of the form.
+
+    """
+    return ('<!DOCTYPE html>\n<html>\n<head>\n<title>{0}</title>\n</head>\n<body>\n'
+            '<form method="post" action="#" id="aspnetForm">\n{1}\n</form>\n</body>\n</html>\n').format(title, body)
+
+
+def listing_page(waypoint="GC1A2B3", logs=20, seed=0):
+    """
+    Generate cache listing page.
+
+    Keyworded arguments:
+        waypoint    --- Waypoint of the cache.
+        logs        --- Number of logs on the page.
+        seed        --- Seed of the random generator.
+
+    """
+    random = Random(seed)
+    name = _text(random, 3).title()
+    owner = _text(random, 1).title()
+    province, country = random.choice(_countries)
+    location = "{0}, {1}".format(province, country) if province else country
+    rows = []
+    for i in range(logs):
+        rows.append({"LogGuid":_guid(random), "LogType":random.choice(_log_types), "Visited":"{0}/{1}/{2}".format(random.randint(1, 12), random.randint(1, 28), random.randint(2005, 2013)),
+                     "UserName":_text(random, 1), "AccountGuid":_guid(random), "LogText":"<p>{0}</p><br /><img src=\"/images/icons/icon_smile.gif\" />".format(_text(random, 40))})
+    attributes = " ".join('<img src="/images/attributes/{0}-yes.gif" alt="{0}" title="{0}" width="30" height="30" />'.format(word) for word in ("dogs", "kids", "scenic", "blank"))
+    inventory = "\n".join('<li>\n<a href="http://www.geocaching.com/track/details.aspx?guid={0}" class="lnk">\n<img src="http://www.geocaching.com/images/wpttypes/sm/21.gif" width="16" /><span>{1}</span></a>\n</li>'.format(_guid(random), _text(random, 2)) for i in range(3))
+    body = """
+<meta name="description" content="{name} ({waypoint}) was created by {owner} on 12/23/2003. It&#39;s a Regular size geocache, with difficulty of 2, terrain of 2.5. It&#39;s located in {location}. {summary}" />
+{inputs}
+<h2><a href="/about/cache_types.aspx" target="_blank" title="About Cache Types"><img src="/images/WptTypes/8.gif" alt="Unknown Cache" width="32" height="32" /></a> {name}</h2>
+<p>A cache by <a href="http://www.geocaching.com/profile/?guid={owner_id}&wid={guid}&ds=2">{owner}</a></p>
+<span class="favorite-value">{favorites}</span>
+<span id="uxLatLon" style="font-weight:bold;">N 49° 06.592 E 016° 27.837</span>
+<div class="UserSuppliedContent">
+<span id="ctl00_ContentBody_ShortDescription">{short}</span>
+</div>
+<div class="UserSuppliedContent">
+<span id="ctl00_ContentBody_LongDescription">{long}</span>
+</div>
+<p>
+</p>
+<p>Additional Hints</p>
+<div id="div_hint" class="HalfLeft">
+                {hint}
+</div>
+<h3>Attributes</h3>
+<div class="WidgetBody">{attributes} <p class="NoBottomSpacing"><small><a href="/about/icons.aspx" title="What are Attributes?">What are Attributes?</a></small></p>
+</div>
+<h3><span id="ctl00_ContentBody_uxTravelBugList_uxInventoryLabel">Inventory</span>
+</h3>
+<div class="WidgetBody">
+<ul>
+{inventory}
+</ul>
+</div>
+<span id="ctl00_ContentBody_lblFindCounts"><p><img src="/images/icons/icon_smile.gif" alt="Found it" />{logs}&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;<img src="/images/icons/icon_note.gif" alt="Write note" />3&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;</p></span>
+<script type="text/javascript">
+var initalLogs = {logs_json};
+</script>
+""".format(name=name, waypoint=waypoint, owner=owner, location=location, summary=_text(random, 20), inputs=_hidden_inputs(random), owner_id=_guid(random), guid=_guid(random),
+           favorites=random.randint(0, 200), short=_text(random, 30), long="".join("<p>{0}</p>\n".format(_text(random, 80)) for i in range(10)), hint=_text(random, 5),
+           attributes=attributes, inventory=inventory, logs=logs, logs_json=json.dumps({"status":"success", "data":rows}))
+    return page(name, body).encode("utf-8")
+
+
+def pm_listing_page(waypoint="GC1A2B3", seed=0):
+    """
+    Generate listing page of PM only cache as seen by basic member.
+
+    Keyworded arguments:
+        waypoint    --- Waypoint of the cache.
+        seed        --- Seed of the random generator.
+
+    """
+    random = Random(seed)
+    name = _text(random, 3).title()
+    body = """
+{inputs}
+<h2><img id="ctl00_ContentBody_uxWptTypeImage" src="http://www.geocaching.com/images/wpttypes/2.gif" style="border-width:0px;vertical-align:middle" /> {waypoint}</h2>
+<span id="ctl00_ContentBody_uxCacheType">A cache by {owner}</span>
+<img src="/images/icons/container/regular.gif" alt="Size: Regular" />&nbsp<small>(Regular)</small>
+<strong><span id="ctl00_ContentBody_lblDifficulty">Difficulty:</span></strong>
+<img src="http://www.geocaching.com/images/stars/stars1.gif" alt="1 out of 5" />
+<strong><span id="ctl00_ContentBody_lblTerrain">Terrain:</span></strong>
+<img src="http://www.geocaching.com/images/stars/stars1_5.gif" alt="1.5 out of 5" />
+<p><img src="/images/icons/16/premium_only.png" alt="Premium Members only" width="16" height="16" />
+The owner of <strong>{name}</strong> has chosen to make this cache listing visible to Premium Members only.</p>
+""".format(inputs=_hidden_inputs(random), waypoint=waypoint, owner=_text(random, 1).title(), name=name)
+    return page(name, body).encode("utf-8")
+
+
+def _seek_row(random):
+    waypoint = _waypoint(random)
+    slug = waypoint.lower()
+    province, country = random.choice(_countries)
+    location = "{0}, {1}".format(province, country) if province else country
+    direction = random.choice(("N", "NE", "E", "SE", "S", "SW", "W", "NW"))
+    found = random.choice(("{0} days ago".format(random.randint(2, 6)), "Yesterday", "{0} {1} {2:02d}".format(random.randint(1, 28), random.choice(_months), random.randint(1, 13))))
+    icons = ""
+    if random.random() < 0.2:
+        icons += '<img src="/images/small_profile.gif" alt="Premium Member Only Cache" title="Premium Member Only Cache" with="15" height="13" />'
+    if random.random() < 0.3:
+        icons += '<a id="ctl00_ContentBody_dlResults_ctl02_uxTravelBugList" class="tblist" href="#">items</a>'
+    return """<tr class="Data BorderTop">
+<td><input type="checkbox" /></td>
+<td><span class="small NoWrap"><img src="/images/icons/compass/{direction}.gif" alt="{direction}" title="{direction}" />{direction}<br />{distance:.1f}mi</span></td>
+<td><span id="ctl00_ContentBody_dlResults_ctl01_uxFavoritesValue" title="9" class="favorite-rank">{favorites}</span></td>
+<td></td>
+<td><a href="http://www.geocaching.com/geocache/{waypoint}_{slug}" class="lnk"><img src="http://www.geocaching.com/images/wpttypes/2.gif" alt="Traditional Cache" title="Traditional Cache" class="SearchResultsWptType" /></a></td>
+<td class="Merge"> <a href="http://www.geocaching.com/geocache/{waypoint}_{slug}" class="lnk  "><span>{name}</span></a>
+<br />
+<span class="small">
+by {owner}
+|
+{waypoint}
+|
+{location}</span>
+</td>
+<td>{icons}</td>
+<td><span class="small">{difficulty}/{terrain}</span><br />
+<img src="/images/icons/container/small.gif" alt="Size: Small" title="Size: Small" /></td>
+<td><span class="small">{hidden_day} {hidden_month} {hidden_year:02d}</span></td>
+<td><span class="small">{found}</span></td>
+<td>
+</td>
+</tr>
+""".format(direction=direction, distance=random.uniform(0.1, 20), favorites=random.randint(0, 50), waypoint=waypoint, slug=slug, name=_text(random, 3).title(), owner=_text(random, 1).title(),
+           location=location, icons=icons, difficulty=random.choice(("1", "1.5", "2", "3.5", "5")), terrain=random.choice(("1", "2.5", "4")),
+           hidden_day=random.randint(1, 28), hidden_month=random.choice(_months), hidden_year=random.randint(1, 13), found=found)
+
+
+def seek_page(rows=20, seed=0, total=None, viewstate=None):
+    """
+    Generate page of seek query results.
+
+    Keyworded arguments:
+        rows        --- Number of caches on the page.
+        seed        --- Seed of the random generator.
+        total       --- Total count of found caches, defaults to five pages.
+        viewstate   --- Value of __VIEWSTATE hidden input, random by default.
+
+    """
+    random = Random(seed)
+    if total is None:
+        total = rows * 5
+    body = """
+{inputs}
+<table class="NoBottomSpacing"><tr><td class="PageBuilderWidget"><span>Total Records: <b>{total}</b></span></td></tr></table>
+<table class="SearchResultsTable Table">
+<tr><th class="Selected"><img src="/images/icons/16/send_to_gps.png" alt="Send to GPS" title="Send to GPS" /></th><th>Name</th></tr>
+{rows}</table>
+""".format(inputs=_hidden_inputs(random, viewstate), total=total, rows="".join(_seek_row(random) for i in range(rows)))
+    return page("Geocache Search", body).encode("utf-8")
+
+
+def my_logs_page(rows=2000, seed=0):
+    """
+    Generate page with the list of user's logs.
+
+    Keyworded arguments:
+        rows        --- Number of logs on the page.
+        seed        --- Seed of the random generator.
+
+    """
+    random = Random(seed)
+    items = []
+    for i in range(rows):
+        guid = _guid(random)
+        province, country = random.choice(_countries)
+        location = "{0}, {1}".format(province, country) if province else country
+        name = _text(random, 3).title()
+        if random.random() < 0.1:
+            name = '<span class="Strike OldWarning">{0}</span>'.format(name)
+        items.append("""<tr class="">
+<td>
+<img src="/images/icons/icon_smile.gif" width="16" height="16" alt="{log_type}" />
+</td>
+<td>
+</td>
+<td>
+{month}/{day}/{year}
+</td>
+<td>
+<a href="http://www.geocaching.com/seek/cache_details.aspx?guid={guid}" class="ImageLink"><img src="http://www.geocaching.com/images/wpttypes/sm/2.gif" title="Traditional Cache" /></a> <a href="http://www.geocaching.com/seek/cache_details.aspx?guid={guid}">{name}</a>&nbsp;
+</td>
+<td>
+{location}
+&nbsp;
+</td>
+<td>
+<a href="http://www.geocaching.com/seek/log.aspx?LUID={luid}" target="_blank" title="Visit Log">Visit Log</a>
+</td>
+</tr>
+""".format(log_type=random.choice(_log_types), month=random.randint(1, 12), day=random.randint(1, 28), year=random.randint(2005, 2013), guid=guid, name=name, location=location, luid=_guid(random)))
+    body = '<table class="Table">\n{0}</table>\n'.format("".join(items))
+    return page("Your logs", body).encode("utf-8")
@@ -5,6 +5,10 @@ Parsing geocaching.com website.
 Classes:
     HTTPInterface       --- Interface retrieving/sending data directly.
                             from/to geocaching.com website.
+    HTTPSession         --- Independent session with geocaching.com website.
+    SharedRateLimiter   --- Pacing state and download stats shared by processes.
+    RetryPolicy         --- Timeouts and retries of failed downloads.
+    MetricsRegistry     --- Counters and histograms of HTTP activity.
     BaseParser          --- Define common parts for all parsers.
     CacheDetails        --- Parse cache details from webpage source.
     MyGeocachingLogs    --- Parse and filter the list of my logs from webpage source.
@@ -12,12 +16,24 @@ Classes:
     SeekResult          --- Sequence wrapper for a result of seek query with lazy loading of next pages.
     Profile             --- Manage user's profile.
     ImageDownloader     --- Thread for downloading images.
+    ImageFetcher        --- Pool of threads downloading images with on-disk cache.
     Image               --- Basic image manipulation.
+    GlyphRecognizer     --- Recognize characters in images by their bitmasks.
+    RefreshScheduler    --- Plan refreshes of cache details within a daily request budget.
+    GPXWriter           --- Streaming writer of cache details to GPX file.
+    JSONLinesWriter     --- Streaming writer of parsed records to JSON Lines file.
+    CacheStore          --- SQLite store for parsed cache details and seek records.
+    ParseProfiler       --- Collect statistics of regular expressions and parsed fields.
+    ResultCache         --- In-memory LRU cache of parsed results with expiration.
+    PageArchive         --- Append-only compressed archive of raw webpages.
+    SpatialIndex        --- In-memory grid index of caches for offline nearest queries.
     Credentials         --- Named tuple for representing credentails.
     CacheLog            --- Named tuple for representing log from cache listing.
     LogItem             --- Named tuple for representing a log from user's profile'.
+    ImageComponent      --- Named tuple for representing a connected component of an image.
     CredentialsError    --- Raised on invalid credentials.
     LoginError          --- Raised when geocaching.com login fails.
+    DownloadError       --- Raised when download fails and retry policy gives up.
 
 """
 
@@ -27,26 +43,54 @@ __license__ = "LGPL 3.0"
 
 __version__ = "0.8.0"
 
-from collections import defaultdict, namedtuple, Sequence, Callable
+from abc import ABCMeta, abstractmethod
+import atexit
+import bz2
+from collections import defaultdict, namedtuple, OrderedDict, Sequence, Callable
+from concurrent.futures import ThreadPoolExecutor
+from copy import copy, deepcopy
 from datetime import date, datetime, timedelta
-from hashlib import md5
+import gzip
+from hashlib import md5, sha1
+import heapq
 from html.parser import HTMLParser
+import http.client
 from http.cookiejar import CookieJar, LWPCookieJar
 import json
 import logging
+import lzma
+import math
+import mmap
 import os
 import os.path
-from random import randint
+from random import randint, random
 import re
+import sqlite3
+import struct
 import subprocess
+import tempfile
 import threading
-from time import time, sleep
+from time import perf_counter, time, sleep
+import types
 import unicodedata
+import urllib.error
 import urllib.parse
 import urllib.request
+import weakref
+from xml.sax.saxutils import escape, quoteattr
+import zlib
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 
 
 __all__ = ["HTTPInterface",
+           "HTTPSession",
+           "SharedRateLimiter",
+           "RetryPolicy",
+           "MetricsRegistry",
            "BaseParser",
            "CacheDetails",
            "MyGeocachingLogs",
@@ -54,12 +98,24 @@ __all__ = ["HTTPInterface",
            "SeekResult",
            "Profile",
            "ImageDownloader",
+           "ImageFetcher",
            "Image",
+           "GlyphRecognizer",
+           "RefreshScheduler",
+           "GPXWriter",
+           "JSONLinesWriter",
+           "CacheStore",
+           "ParseProfiler",
+           "ResultCache",
+           "PageArchive",
+           "SpatialIndex",
            "Credentials",
            "CacheLog",
            "LogItem",
+           "ImageComponent",
            "CredentialsError",
-           "LoginError"]
+           "LoginError",
+           "DownloadError"]
 
 
 ############################################################
@@ -82,6 +138,14 @@ class LoginError(AssertionError):
     pass
 
 
+class DownloadError(IOError):
+    """
+    Raised when download fails and retry policy gives up.
+
+    """
+    pass
+
+
 
 ############################################################
 ### Data containers & design patterns                    ###
@@ -93,6 +157,73 @@ Credentials = namedtuple("Credentials", "username password")
 CacheLog = namedtuple("CacheLog", "luid type date user user_id text")
 """ Named tuple for representing a log from user's profile'. """
 LogItem = namedtuple("LogItem", "luid type date cache")
+""" Named tuple for representing a connected component of an image. """
+ImageComponent = namedtuple("ImageComponent", "left top right bottom image")
+
+
+class _hybridmethod:
+    """
+    Method bound to the instance when accessed via instance, or to the class
+    otherwise.
+
+    """
+
+    def __init__(self, func):
+        self.__func__ = func
+        self.__doc__ = func.__doc__
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return types.MethodType(self.__func__, objtype)
+        return types.MethodType(self.__func__, obj)
+
+
+class _SingleFlight:
+    """
+    Coalesce concurrent calls with the same key into one call.
+
+    Attributes:
+        shared      --- Number of calls served by result of another call.
+
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.shared = 0
+
+    def do(self, key, func):
+        """
+        Call func, or wait for result of the running call with the same key.
+
+        Arguments:
+            key         --- Hashable key of the call.
+            func        --- Function without arguments.
+
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = {"event":threading.Event(), "result":None, "error":None}
+                self._calls[key] = call
+            else:
+                self.shared += 1
+        if not leader:
+            call["event"].wait()
+            if call["error"] is not None:
+                raise call["error"]
+            return call["result"]
+        try:
+            call["result"] = func()
+        except BaseException as e:
+            call["error"] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call["event"].set()
+        return call["result"]
 
 
 class StaticClass:
@@ -143,15 +274,472 @@ class HTTPRedirectHandler(urllib.request.HTTPRedirectHandler):
         return urllib.request.HTTPRedirectHandler.http_error_302(self, req, fp, code, msg, headers)
 
 
+_not_signed_in_marker = b"<p class=\"NotSignedInText\">"
+
+def _reserve_download(state, auth, request_avg_time):
+    """
+    Reserve time slot for the next download, return its timestamp.
+
+    Arguments:
+        state       --- Dictionary with pacing state (first_download,
+                        download_count, last_download), updated in place.
+        auth        --- Is this for a page where autentication is needed?
+        request_avg_time --- Desired average request sleep time.
+
+    """
+    now = time()
+    if not auth:
+        sleep_time = 1
+    else:
+        # No request for a long time => reset first_download value using desired average.
+        state["first_download"] = max(now - state["download_count"] * request_avg_time, state["first_download"])
+        # Calculate number of downloaded pages ahead of expected average
+        count = state["download_count"] - int((now - state["first_download"]) / request_avg_time)
+        # sleep time 1s: 10/10s => overall 10/10s
+        if count < 10:
+            sleep_time = 1
+        # sleep time 2-8s: 40/3.3m => overall 50/3.5min
+        elif count < 50:
+            sleep_time = randint(2, 8)
+        # sleep time 5-35s: 155/51.6m => overall 205/55.1min
+        elif count < 200:
+            sleep_time = randint(5, 35)
+        # sleep time 10-50s: 315/2.6h => overall 520/3.5h
+        elif count < 500:
+            sleep_time = randint(10, 50)
+        # sleep time 20-80s
+        else:
+            sleep_time = randint(20, 80)
+        state["download_count"] += 1
+    state["last_download"] = max(now, state["last_download"] + sleep_time)
+    return state["last_download"]
+
+
+class RetryPolicy:
+    """
+    Timeouts and retries of failed downloads.
+
+    Attributes:
+        timeout     --- Socket timeout in seconds, applies to connecting and to
+                        every read of the response.
+        max_attempts --- Maximum number of attempts, None for unlimited.
+        deadline    --- Maximum total time of all attempts in seconds, None for
+                        unlimited.
+        backoff     --- Wait time before the first retry in seconds.
+        multiplier  --- Multiplier of the wait time for each next retry.
+        max_backoff --- Maximum wait time between retries in seconds.
+        jitter      --- Maximum random reduction of the wait time (fraction).
+
+    Methods:
+        delay       --- Return wait time before the next attempt.
+        retryable   --- Return True, if the error should be retried.
+
+    """
+
+    def __init__(self, timeout=60, max_attempts=10, deadline=None, backoff=1, multiplier=2, max_backoff=600, jitter=0.5):
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.deadline = deadline
+        self.backoff = backoff
+        self.multiplier = multiplier
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+
+    def delay(self, attempt):
+        """
+        Return wait time before the next attempt.
+
+        Arguments:
+            attempt     --- Number of the failed attempt (starting with 1).
+
+        """
+        delay = min(self.max_backoff, self.backoff * self.multiplier ** (attempt - 1))
+        return delay * (1 - self.jitter * random())
+
+    def retryable(self, error):
+        """
+        Return True, if the error should be retried - server errors, timeouts and
+        connection errors are retried, client errors (except 408 and 429) are not.
+
+        Arguments:
+            error       --- Exception raised by the download.
+
+        """
+        if isinstance(error, urllib.error.HTTPError):
+            return error.code >= 500 or error.code in (408, 429)
+        return True
+
+
+class SharedRateLimiter:
+    """
+    Pacing state and download stats shared by all processes using the same state
+    file, the file is locked by fcntl (where available).
+
+    Methods:
+        reserve     --- Reserve time slot for the next download.
+        count       --- Count downloaded page with auth=True in shared stats.
+        merge       --- Merge download stats into shared stats.
+        stats       --- Return shared download stats.
+
+    """
+
+    def __init__(self, filename):
+        """
+        Arguments:
+            filename    --- Path to the state file.
+
+        """
+        self._log = logging.getLogger("gcparser.http.SharedRateLimiter")
+        self._filename = os.path.expanduser(filename)
+        self._lock = threading.Lock()
+        if fcntl is None:
+            self._log.warn("File locking is not available, rate limit will not be shared with other processes.")
+
+    def _update(self, func):
+        """ Call func on the state loaded from file under lock and save the state if changed. """
+        with self._lock, open(self._filename + ".lock", "a") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+            try:
+                try:
+                    with open(self._filename, "r", encoding="utf-8") as fp:
+                        state = json.load(fp)
+                except (IOError, ValueError):
+                    state = {}
+                state.setdefault("pace", {"first_download":0, "download_count":0, "last_download":0})
+                state.setdefault("stats", {})
+                original = json.dumps(state, sort_keys=True)
+                result = func(state)
+                if json.dumps(state, sort_keys=True) != original:
+                    _write_atomic(self._filename, json.dumps(state).encode("utf-8"))
+                return result
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+
+    def reserve(self, auth, request_avg_time):
+        """
+        Reserve time slot for the next download, return its timestamp.
+
+        Arguments:
+            auth        --- Is this for a page where autentication is needed?
+            request_avg_time --- Desired average request sleep time.
+
+        """
+        return self._update(lambda state: _reserve_download(state["pace"], auth, request_avg_time))
+
+    def count(self, day):
+        """
+        Count downloaded page with auth=True in shared stats, return the stats.
+
+        Arguments:
+            day         --- Date in ISO format.
+
+        """
+        def count(state):
+            stats = state["stats"]
+            stats[day] = stats.get(day, 0) + 1
+            timeout = (date.today() - timedelta(days=93)).isoformat()
+            for download_date in [download_date for download_date in stats if download_date <= timeout]:
+                del stats[download_date]
+            return dict(stats)
+        return self._update(count)
+
+    def merge(self, stats):
+        """
+        Merge download stats into shared stats taking the maximum of each day,
+        return the shared stats.
+
+        Arguments:
+            stats       --- Dictionary of download counts by date in ISO format.
+
+        """
+        def merge(state):
+            shared = state["stats"]
+            for day, count in stats.items():
+                if count > shared.get(day, 0):
+                    shared[day] = count
+            return dict(shared)
+        return self._update(merge)
+
+    def stats(self):
+        """
+        Return shared download stats.
+
+        """
+        return self._update(lambda state: dict(state["stats"]))
+
+
+class MetricsRegistry:
+    """
+    Counters and histograms of HTTP activity with Prometheus text export.
+
+    HTTPInterface reports events (see emit) into its metrics attribute, hooks
+    are called with every event.
+
+    Attributes:
+        filename    --- File written by write (and HTTPInterface.flush), or None.
+
+    Methods:
+        counter     --- Declare a counter.
+        histogram   --- Declare a histogram.
+        inc         --- Increase a counter.
+        observe     --- Add value to a histogram.
+        emit        --- Record an event and pass it to hooks.
+        add_hook    --- Register callback called with every event.
+        remove_hook --- Unregister callback.
+        snapshot    --- Return dictionary with current values.
+        export      --- Return metrics in Prometheus text exposition format.
+        write       --- Write exported metrics to file.
+
+    Events:
+        request     --- url, auth, elapsed: request finished.
+        wait        --- auth, seconds: time slept before download.
+        attempt     --- url, attempt, latency, ttfb, size, error: one download
+                        attempt finished.
+        relogin     --- url: page was downloaded while logged out.
+        cache_hit   --- source, id: parser result served without download.
+
+    """
+
+    buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+    def __init__(self, filename=None):
+        """
+        Keyworded arguments:
+            filename    --- File written by write.
+
+        """
+        self.filename = filename
+        self._lock = threading.Lock()
+        self._metrics = OrderedDict()
+        self._hooks = []
+        self.counter("gcparser_requests_total", "Requests to geocaching.com.")
+        self.histogram("gcparser_request_seconds", "Duration of requests including waiting and retries.")
+        self.histogram("gcparser_wait_seconds", "Time slept before downloads to lessen the load.")
+        self.counter("gcparser_download_attempts_total", "Download attempts by result.")
+        self.counter("gcparser_retries_total", "Repeated download attempts.")
+        self.histogram("gcparser_ttfb_seconds", "Time from sending the request to receiving response headers.")
+        self.histogram("gcparser_download_seconds", "Time of reading the response body.")
+        self.counter("gcparser_received_bytes_total", "Size of received response bodies.")
+        self.counter("gcparser_relogins_total", "Pages downloaded while logged out.")
+        self.counter("gcparser_cache_hits_total", "Parser results served without download by source.")
+
+    def counter(self, name, help):
+        """
+        Declare a counter.
+
+        Arguments:
+            name        --- Metric name.
+            help        --- Description of the metric.
+
+        """
+        with self._lock:
+            self._metrics.setdefault(name, {"type":"counter", "help":help, "values":{}})
+
+    def histogram(self, name, help, buckets=None):
+        """
+        Declare a histogram.
+
+        Arguments:
+            name        --- Metric name.
+            help        --- Description of the metric.
+
+        Keyworded arguments:
+            buckets     --- Sorted upper bounds of buckets.
+
+        """
+        with self._lock:
+            self._metrics.setdefault(name, {"type":"histogram", "help":help, "values":{}, "buckets":tuple(buckets or self.buckets)})
+
+    @staticmethod
+    def _labels(labels):
+        return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        """
+        Increase a counter.
+
+        Arguments:
+            name        --- Metric name.
+
+        Keyworded arguments:
+            value       --- Increment.
+            labels      --- Label values.
+
+        """
+        key = self._labels(labels)
+        with self._lock:
+            values = self._metrics[name]["values"]
+            values[key] = values.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        """
+        Add value to a histogram.
+
+        Arguments:
+            name        --- Metric name.
+            value       --- Observed value.
+
+        Keyworded arguments:
+            labels      --- Label values.
+
+        """
+        key = self._labels(labels)
+        with self._lock:
+            metric = self._metrics[name]
+            if key not in metric["values"]:
+                metric["values"][key] = [[0] * len(metric["buckets"]), 0.0, 0]
+            counts, total, count = metric["values"][key]
+            for i, bound in enumerate(metric["buckets"]):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            metric["values"][key][1] = total + value
+            metric["values"][key][2] = count + 1
+
+    def emit(self, event, **fields):
+        """
+        Record an event and pass it to hooks.
+
+        Arguments:
+            event       --- Event name, see class documentation.
+
+        Keyworded arguments:
+            fields      --- Event details.
+
+        """
+        if event == "request":
+            auth = str(bool(fields["auth"])).lower()
+            self.inc("gcparser_requests_total", auth=auth)
+            self.observe("gcparser_request_seconds", fields["elapsed"], auth=auth)
+        elif event == "wait":
+            self.observe("gcparser_wait_seconds", fields["seconds"], auth=str(bool(fields["auth"])).lower())
+        elif event == "attempt":
+            if fields["error"] is None:
+                self.inc("gcparser_download_attempts_total", result="ok")
+                self.inc("gcparser_received_bytes_total", fields["size"] or 0)
+                self.observe("gcparser_download_seconds", fields["latency"] - fields["ttfb"])
+            else:
+                self.inc("gcparser_download_attempts_total", result="error")
+            if fields["ttfb"] is not None:
+                self.observe("gcparser_ttfb_seconds", fields["ttfb"])
+            if fields["attempt"] > 1:
+                self.inc("gcparser_retries_total")
+        elif event == "relogin":
+            self.inc("gcparser_relogins_total")
+        elif event == "cache_hit":
+            self.inc("gcparser_cache_hits_total", source=fields["source"])
+        for hook in list(self._hooks):
+            hook(event, fields)
+
+    def add_hook(self, hook):
+        """
+        Register callback called with every event.
+
+        Arguments:
+            hook        --- Callable taking event name and dictionary of fields.
+
+        """
+        self._hooks.append(hook)
+
+    def remove_hook(self, hook):
+        """
+        Unregister callback.
+
+        Arguments:
+            hook        --- Callable registered by add_hook.
+
+        """
+        self._hooks.remove(hook)
+
+    def snapshot(self):
+        """
+        Return dictionary with current values.
+
+        Counters map label tuples to values, histograms to dictionaries with
+        buckets (cumulative counts by upper bound), sum and count.
+
+        """
+        result = {}
+        with self._lock:
+            for name, metric in self._metrics.items():
+                values = {}
+                for key, value in metric["values"].items():
+                    if metric["type"] == "histogram":
+                        cumulative = 0
+                        buckets = []
+                        for bound, count in zip(metric["buckets"], value[0]):
+                            cumulative += count
+                            buckets.append((bound, cumulative))
+                        value = {"buckets":buckets, "sum":value[1], "count":value[2]}
+                    values[key] = value
+                result[name] = values
+        return result
+
+    @staticmethod
+    def _format_labels(key, extra=()):
+        items = list(key) + list(extra)
+        if not items:
+            return ""
+        return "{" + ",".join("{0}=\"{1}\"".format(name, value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")) for name, value in items) + "}"
+
+    def export(self):
+        """
+        Return metrics in Prometheus text exposition format.
+
+        """
+        snapshot = self.snapshot()
+        lines = []
+        for name, metric in self._metrics.items():
+            lines.append("# HELP {0} {1}".format(name, metric["help"]))
+            lines.append("# TYPE {0} {1}".format(name, metric["type"]))
+            for key, value in sorted(snapshot[name].items()):
+                if metric["type"] == "counter":
+                    lines.append("{0}{1} {2}".format(name, self._format_labels(key), repr(float(value))))
+                    continue
+                for bound, count in value["buckets"]:
+                    lines.append("{0}_bucket{1} {2}".format(name, self._format_labels(key, (("le", repr(float(bound))),)), count))
+                lines.append("{0}_bucket{1} {2}".format(name, self._format_labels(key, (("le", "+Inf"),)), value["count"]))
+                lines.append("{0}_sum{1} {2}".format(name, self._format_labels(key), repr(value["sum"])))
+                lines.append("{0}_count{1} {2}".format(name, self._format_labels(key), value["count"]))
+        return "\n".join(lines) + "\n"
+
+    def write(self, filename=None):
+        """
+        Write exported metrics to file (atomically).
+
+        Keyworded arguments:
+            filename    --- Output file, defaults to filename attribute.
+
+        """
+        if filename is None:
+            filename = self.filename
+        _write_atomic(os.path.expanduser(filename), self.export().encode("utf-8"))
+
+
 class HTTPInterface(StaticClass):
     """
     Interface retrieving/sending data directly from/to geocaching.com website.
-    Cannot be instantionalized.
+    Cannot be instantionalized, see HTTPSession for independent sessions.
 
     Attributes:
         stats            --- Dictionary with download stats of pages with auth=True.
         request_avg_time --- Desired average request sleep time for pages with
                              auth=True.
+        persist_interval --- Minimal interval in seconds between saving of
+                             cookies and stats (unless cookies change),
+                             changes are saved after it also when idle.
+        limiter          --- SharedRateLimiter instance, or None.
+        login_check_limit --- Number of bytes at the start of the page searched
+                             for the 'not logged in' marker.
+        retry_policy     --- RetryPolicy instance used for downloads.
+        archive          --- PageArchive instance where downloaded pages are
+                             stored, or None.
+        base_url         --- Scheme and host used instead of
+                             www.geocaching.com (e.g. local test server),
+                             or None.
+        metrics          --- MetricsRegistry instance receiving events, or None.
 
     Methods:
         set_credentials --- Set credentials to use for geocaching.com login.
@@ -163,6 +751,9 @@ class HTTPInterface(StaticClass):
         download_url    --- Download data from URL.
         wait            --- Handle wait time to lessen the load on geocaching.com
                             website.
+        flush           --- Save changed cookies and stats.
+        share_limiter   --- Share pacing and download stats with other processes
+                            using the same data directory and account.
 
     """
 
@@ -174,11 +765,22 @@ class HTTPInterface(StaticClass):
     _last_download = 0
     _first_download = 0
     _download_count = 0
+    _dirty = False
+    _last_flush = 0
+    _cookies_state = None
 
     stats = defaultdict(int)
     request_avg_time = 600
-
-    @classmethod
+    persist_interval = 60
+    limiter = None
+    login_check_limit = 65536
+    retry_policy = RetryPolicy()
+    archive = None
+    base_url = None
+    metrics = None
+    _flights = _SingleFlight()
+
+    @_hybridmethod
     def set_credentials(cls, credentials):
         """
         Set credentials to use for geocaching.com login.
@@ -191,10 +793,12 @@ class HTTPInterface(StaticClass):
             raise CredentialsError("Credentials must be an instance of Credentials.")
         if credentials.username is None or credentials.password is None:
             cls._log.warn("No geocaching.com credentials given, some features won't be accessible.")
+        cls.flush()
         cls._credentials = credentials
         cls._load_stats()
+        cls._rebind_limiter()
 
-    @classmethod
+    @_hybridmethod
     def get_data_dir(cls, data_dir=None):
         """
         Get data directory.
@@ -202,7 +806,7 @@ class HTTPInterface(StaticClass):
         """
         return cls._data_dir
 
-    @classmethod
+    @_hybridmethod
     def set_data_dir(cls, data_dir=None):
         """
         Set data directory for for storing cookies, user_agent, download stats...
@@ -212,6 +816,7 @@ class HTTPInterface(StaticClass):
                             home directory)
 
         """
+        cls.flush()
         if data_dir is None:
             cls._log.warn("No data directory provided, caching will be disabled.")
             cls._data_dir = None
@@ -224,9 +829,10 @@ class HTTPInterface(StaticClass):
                 cls._log.warn("Data directory '{0}' does not exist, caching will be disabled.".format(data_dir))
                 cls._data_dir = None
         cls._load_stats()
+        cls._rebind_limiter()
 
-    @classmethod
-    def request(cls, url, auth=False, data=None, check=True):
+    @_hybridmethod
+    def request(cls, url, auth=False, data=None, check=True, raw=False):
         """
         Retrive/send data from/to geocaching.com website.
 
@@ -237,23 +843,59 @@ class HTTPInterface(StaticClass):
             auth        --- Authenticate before request.
             data        --- Data to send with request.
             check       --- Re-check if we're logged in after download.
+            raw         --- Return undecoded bytes instead of string.
+
+        Concurrent identical requests share one download.
 
         """
+        if data is not None:
+            key = (url, auth, check, tuple(sorted(data.items())))
+        else:
+            key = (url, auth, check, None)
+        start = time()
+        webpage = cls._flights.do(key, lambda: cls._request(url, auth, data, check))
+        if cls.metrics is not None:
+            cls.metrics.emit("request", url=url, auth=auth, elapsed=time() - start)
+            if cls.metrics.filename is not None and not auth:
+                # Pages with auth=True are persisted already.
+                cls._persist()
+        if raw:
+            return webpage
+        return webpage.decode("utf-8")
+
+    @_hybridmethod
+    def _request(cls, url, auth, data, check):
+        """ Download the page, see request. """
         opener = cls.build_opener(auth)
         cls.wait(auth)
-        webpage = cls.download_url(opener, url, data).decode("utf-8")
+        webpage = cls.download_url(opener, cls._site_url(url), data, check_login=auth and check)
         if auth:
-            cls._save_cookies()
             today = date.today().isoformat()
-            cls.stats[today] += 1
-            cls._save_stats()
-        if auth and check and not cls._check_login(webpage):
+            if cls.limiter is not None:
+                cls.stats = defaultdict(int, cls.limiter.count(today))
+            else:
+                cls.stats[today] += 1
+            cls._persist()
+        if webpage is None:
             cls._log.debug("We're not actually logged in, refreshing login and redownloading page.")
+            if cls.metrics is not None:
+                cls.metrics.emit("relogin", url=url)
             cls._login()
-            return cls.request(url, auth=auth, data=data)
+            return cls._request(url, auth, data, check)
+        if cls.archive is not None:
+            cls.archive.put(webpage, (url,))
         return webpage
 
-    @classmethod
+    @_hybridmethod
+    def _site_url(cls, url):
+        """ Rewrite geocaching.com URL to base_url. """
+        if cls.base_url is not None:
+            for prefix in ("http://www.geocaching.com", "https://www.geocaching.com"):
+                if url.startswith(prefix):
+                    return cls.base_url.rstrip("/") + url[len(prefix):]
+        return url
+
+    @_hybridmethod
     def build_opener(cls, auth=False):
         """
         Build URL opener.
@@ -275,8 +917,8 @@ class HTTPInterface(StaticClass):
         opener.addheaders = headers
         return opener
 
-    @classmethod
-    def download_url(cls, opener, url, data=None, retryTime=1):
+    @_hybridmethod
+    def download_url(cls, opener, url, data=None, retryTime=None, check_login=False, policy=None):
         """
         Download data from URL.
 
@@ -286,23 +928,81 @@ class HTTPInterface(StaticClass):
 
         Keyworded arguments:
             data        --- POST data.
-            retryTime   --- Number of seconds to wait before retry when download fails.
+            retryTime   --- Number of seconds to wait before the first retry when
+                            download fails (overrides policy.backoff).
+            check_login --- Abort download and return None, if the page header
+                            says we're not logged in.
+            policy      --- RetryPolicy instance, defaults to retry_policy.
 
         """
-        cls._log.debug("Downloading page '{0}'.".format(url))
-        try:
-            if data is not None:
-                response = opener.open(url, urllib.parse.urlencode(data).encode("utf-8"))
-            else:
-                response = opener.open(url)
-            response = response.read()
-        except IOError:
-            cls._log.error("An error occured while downloading '{0}', will retry in {1} seconds.".format(url, retryTime))
-            sleep(retryTime)
-            return cls.download_url(opener, url, data, retryTime=min(5*retryTime, 600))
-        return response
+        if policy is None:
+            policy = cls.retry_policy
+        if retryTime is not None:
+            policy = copy(policy)
+            policy.backoff = retryTime
+        if data is not None:
+            data = urllib.parse.urlencode(data).encode("utf-8")
+        start = time()
+        attempt = 0
+        while True:
+            attempt += 1
+            cls._log.debug("Downloading page '{0}' (attempt {1}).".format(url, attempt))
+            attempt_start = time()
+            ttfb = None
+            try:
+                response = opener.open(url, data, timeout=policy.timeout)
+                ttfb = time() - attempt_start
+                response = cls._read_response(response, check_login)
+            except (IOError, http.client.HTTPException) as e:
+                cls._report_attempt(url, attempt, time() - attempt_start, e, ttfb)
+                if not policy.retryable(e):
+                    raise DownloadError("Download of '{0}' failed: {1}".format(url, e)) from e
+                delay = policy.delay(attempt)
+                if policy.max_attempts is not None and attempt >= policy.max_attempts:
+                    raise DownloadError("Download of '{0}' failed after {1} attempts: {2}".format(url, attempt, e)) from e
+                if policy.deadline is not None and time() + delay - start > policy.deadline:
+                    raise DownloadError("Download of '{0}' failed, deadline exceeded: {1}".format(url, e)) from e
+                cls._log.error("An error occured while downloading '{0}' ({1}), will retry in {2:.1f} seconds.".format(url, e, delay))
+                sleep(delay)
+                continue
+            cls._report_attempt(url, attempt, time() - attempt_start, None, ttfb, len(response) if response is not None else 0)
+            return response
+
+    @_hybridmethod
+    def _report_attempt(cls, url, attempt, latency, error, ttfb=None, size=None):
+        """ Report result of one download attempt. """
+        if cls.metrics is not None:
+            cls.metrics.emit("attempt", url=url, attempt=attempt, latency=latency, ttfb=ttfb, size=size, error=error)
+        if error is None:
+            cls._log.debug("Attempt {0} to download '{1}' succeeded in {2:.3f} seconds.".format(attempt, url, latency))
+        else:
+            cls._log.debug("Attempt {0} to download '{1}' failed in {2:.3f} seconds.".format(attempt, url, latency))
 
-    @classmethod
+    @_hybridmethod
+    def _read_response(cls, response, check_login=False):
+        """ Read response body, return None if check_login is set and we're not logged in. """
+        if not check_login:
+            return response.read()
+        cls._log.debug("Checking if we're really logged in...")
+        marker = _not_signed_in_marker
+        chunks = []
+        received = 0
+        tail = b""
+        while True:
+            chunk = response.read(16384)
+            if not chunk:
+                break
+            if received < cls.login_check_limit:
+                if marker in tail + chunk:
+                    cls._log.debug("Not logged in, aborting download.")
+                    response.close()
+                    return None
+                tail = chunk[-len(marker)+1:]
+            chunks.append(chunk)
+            received += len(chunk)
+        return b"".join(chunks)
+
+    @_hybridmethod
     def _user_file_name(cls):
         """ Returns filename to store user's data. """
         username = cls._credentials.username
@@ -314,7 +1014,7 @@ class HTTPInterface(StaticClass):
         name = name + "_" + hash_
         return os.path.join(cls._data_dir, name)
 
-    @classmethod
+    @_hybridmethod
     def _get_cookies(cls):
         """ Get cookies - load from file, or create. """
         if cls._cookies is not None:
@@ -344,14 +1044,71 @@ class HTTPInterface(StaticClass):
                 cls._login()
         return cls._cookies
 
-    @classmethod
+    @_hybridmethod
+    def share_limiter(cls):
+        """
+        Share pacing and download stats with other processes using the same data
+        directory and account.
+
+        """
+        user_file = cls._user_file_name()
+        if user_file is None:
+            cls._log.warn("Cannot share rate limiter - invalid filename.")
+            return
+        cls.limiter = SharedRateLimiter(user_file + ".pace")
+        # Do not lose pages counted by this process before sharing.
+        cls.stats = defaultdict(int, cls.limiter.merge(cls.stats))
+
+    @_hybridmethod
+    def _rebind_limiter(cls):
+        """ Share the limiter of the current account and data directory, if sharing. """
+        if cls.limiter is not None:
+            cls.limiter = None
+            cls.share_limiter()
+
+    @_hybridmethod
+    def _persist(cls):
+        """ Mark cookies and stats as changed, save them if cookies changed or persist_interval elapsed. """
+        cls._dirty = True
+        _persistent.add(cls)
+        _start_flusher()
+        cookies_state = None
+        if cls._cookies is not None:
+            cookies_state = sorted((cookie.domain, cookie.path, cookie.name, cookie.value, cookie.expires) for cookie in cls._cookies)
+        if cookies_state != cls._cookies_state or time() - cls._last_flush >= cls.persist_interval:
+            cls._cookies_state = cookies_state
+            cls.flush()
+
+    @_hybridmethod
+    def flush(cls):
+        """
+        Save changed cookies and stats (and metrics, if metrics.filename is set).
+
+        """
+        if not cls._dirty:
+            return
+        cls._dirty = False
+        cls._last_flush = time()
+        cls._save_cookies()
+        cls._save_stats()
+        if cls.metrics is not None and cls.metrics.filename is not None:
+            cls.metrics.write()
+
+    @_hybridmethod
     def _save_cookies(cls):
         """ Try to save cookies, if possible. """
         if isinstance(cls._cookies, LWPCookieJar):
             cls._log.debug("Saving cookies.")
-            cls._cookies.save(ignore_discard=True, ignore_expires=True)
-
-    @classmethod
+            fd, temp_name = tempfile.mkstemp(dir=os.path.dirname(cls._cookies.filename), prefix=".tmp-")
+            os.close(fd)
+            try:
+                cls._cookies.save(temp_name, ignore_discard=True, ignore_expires=True)
+                os.replace(temp_name, cls._cookies.filename)
+            finally:
+                if os.path.exists(temp_name):
+                    os.unlink(temp_name)
+
+    @_hybridmethod
     def _get_user_agent(cls):
         """ Return current user_agent, or load from file, or generate random one. """
         if cls._user_agent is not None:
@@ -370,7 +1127,7 @@ class HTTPInterface(StaticClass):
                 cls._save_user_agent()
         return cls._user_agent
 
-    @classmethod
+    @_hybridmethod
     def _save_user_agent(cls):
         """ Try to save user agent, if possible. """
         if cls._user_agent is None:
@@ -379,11 +1136,10 @@ class HTTPInterface(StaticClass):
         if user_file is None:
             return
         ua_file = user_file + ".ua"
-        with open(ua_file, "w", encoding="utf-8") as fp:
-            cls._log.debug("Saving user agent.")
-            fp.write(cls._user_agent)
+        cls._log.debug("Saving user agent.")
+        _write_atomic(ua_file, cls._user_agent.encode("utf-8"))
 
-    @classmethod
+    @_hybridmethod
     def _generate_user_agent(cls):
         """ Generate random user_agent string - masking as Firefox 3.0.x. """
         cls._log.debug("Generating user agent.")
@@ -402,7 +1158,7 @@ class HTTPInterface(StaticClass):
         date = "200907{0:02d}{1:02d}".format(randint(1, 31), randint(1, 23))
         return "Mozilla/5.0 ({0}; U; {1}; en-US; rv:1.9.0.{2:d}) Gecko/{3} Firefox/3.0.{2:d}".format(system, system_version, version, date)
 
-    @classmethod
+    @_hybridmethod
     def _load_stats(cls):
         """ Load download stats from file. """
         cls.stats = defaultdict(int)
@@ -426,19 +1182,21 @@ class HTTPInterface(StaticClass):
                     if download_date > timeout:
                         cls.stats[download_date.isoformat()] = download_count
 
-    @classmethod
+    @_hybridmethod
     def _save_stats(cls):
         """ Try to save stats, if possible. """
         user_file = cls._user_file_name()
         if user_file is None:
             return
+        if cls.limiter is not None:
+            # Stats are kept by shared limiter.
+            return
         stats_file = user_file + ".stats"
-        with open(stats_file, "w", encoding="utf-8") as fp:
-            cls._log.debug("Saving stats.")
-            for download_date, download_count in cls.stats.items():
-                fp.write("{0}\t{1}\n".format(download_date, download_count))
+        cls._log.debug("Saving stats.")
+        lines = ["{0}\t{1}\n".format(download_date, download_count) for download_date, download_count in cls.stats.items()]
+        _write_atomic(stats_file, "".join(lines).encode("utf-8"))
 
-    @classmethod
+    @_hybridmethod
     def _login(cls):
         """ Log in to geocaching.com, save cookiejar. """
         if not cls._login_attempt():
@@ -448,7 +1206,7 @@ class HTTPInterface(StaticClass):
                 raise LoginError("Cannot log in.")
         cls._log.debug("Logged in.")
 
-    @classmethod
+    @_hybridmethod
     def _login_attempt(cls):
         """ Attempt to log in to geocaching.com. """
         cls._log.debug("Attempting to log in.")
@@ -469,17 +1227,7 @@ class HTTPInterface(StaticClass):
                 return True
         return False
 
-    @classmethod
-    def _check_login(cls, data):
-        """ Checks the downloaded data and determines if we're logged in. """
-        cls._log.debug("Checking if we're really logged in...")
-        if data is not None:
-            for line in data.splitlines():
-                if line.find("<p class=\"NotSignedInText\">") != -1:
-                    return False
-        return True
-
-    @classmethod
+    @_hybridmethod
     def wait(cls, auth):
         """
         Handle wait time to lessen the load on geocaching.com website.
@@ -488,36 +1236,105 @@ class HTTPInterface(StaticClass):
             auth        --- Is this for a page where autentication is needed?
 
         """
-        if not auth:
-            sleep_time = 1
+        if cls.limiter is not None:
+            slot = cls.limiter.reserve(auth, cls.request_avg_time)
         else:
-            # No request for a long time => reset _first_download value using desired average.
-            cls._first_download = max(time() - cls._download_count * cls.request_avg_time, cls._first_download)
-            # Calculate number of downloaded pages ahead of expected average
-            count = cls._download_count - int((time() - cls._first_download) / cls.request_avg_time)
-            # sleep time 1s: 10/10s => overall 10/10s
-            if count < 10:
-                sleep_time = 1
-            # sleep time 2-8s: 40/3.3m => overall 50/3.5min
-            elif count < 50:
-                sleep_time = randint(2, 8)
-            # sleep time 5-35s: 155/51.6m => overall 205/55.1min
-            elif count < 200:
-                sleep_time = randint(5, 35)
-            # sleep time 10-50s: 315/2.6h => overall 520/3.5h
-            elif count < 500:
-                sleep_time = randint(10, 50)
-            # sleep time 20-80s
-            else:
-                sleep_time = randint(20, 80)
-            cls._download_count += 1
-        cls._log.debug("Waiting for {0} seconds.".format(sleep_time))
-        sleep(max(0, cls._last_download + sleep_time - time()))
-        cls._last_download = time()
+            state = {"first_download":cls._first_download, "download_count":cls._download_count, "last_download":cls._last_download}
+            slot = _reserve_download(state, auth, cls.request_avg_time)
+            cls._first_download = state["first_download"]
+            cls._download_count = state["download_count"]
+            cls._last_download = state["last_download"]
+        sleep_time = max(0, slot - time())
+        cls._log.debug("Waiting for {0:.1f} seconds.".format(sleep_time))
+        if cls.metrics is not None:
+            cls.metrics.emit("wait", auth=auth, seconds=sleep_time)
+        sleep(sleep_time)
 
 
 HTTPInterface.set_data_dir("~/.geocaching/parser")
 
+""" HTTP interfaces with possibly unsaved cookies and stats. """
+_persistent = weakref.WeakSet()
+
+@atexit.register
+def _flush_all():
+    """ Save changed cookies and stats of all HTTP interfaces on exit. """
+    for http in list(_persistent):
+        http.flush()
+
+
+_flusher = None
+_flusher_lock = threading.Lock()
+
+
+def _start_flusher():
+    """ Start background thread saving changes of idle HTTP interfaces, if not running. """
+    global _flusher
+    with _flusher_lock:
+        if _flusher is None:
+            _flusher = threading.Thread(target=_flush_loop, name="gcparser-flush")
+            _flusher.daemon = True
+            _flusher.start()
+
+
+def _flush_loop():
+    """ Save changes of HTTP interfaces not saved for persist_interval. """
+    log = logging.getLogger("gcparser.http")
+    while True:
+        https = list(_persistent)
+        sleep(max(1, min([http.persist_interval for http in https] or [60])))
+        for http in https:
+            if http._dirty and time() - http._last_flush >= http.persist_interval:
+                try:
+                    http.flush()
+                except Exception as e:
+                    log.error("Saving of cookies and stats failed: {0}".format(e))
+
+
+class HTTPSession(HTTPInterface):
+    """
+    Independent session with geocaching.com website with its own credentials,
+    cookies, user agent, download stats and wait time handling.
+
+    Provides the same interface as HTTPInterface, can be passed to parsers as
+    session keyworded argument.
+
+    """
+
+    def __new__(cls, *p, **k):
+        return object.__new__(cls)
+
+    def __init__(self, credentials=None, data_dir=None):
+        """
+        Keyworded arguments:
+            credentials --- Credentials instance.
+            data_dir    --- Path to data directory (use '~' as a link to user's
+                            home directory), if None, caching will be disabled.
+
+        """
+        self._data_dir = None
+        self._credentials = Credentials(None, None)
+        self._cookies = None
+        self._user_agent = None
+        self._last_download = 0
+        self._first_download = 0
+        self._download_count = 0
+        self._dirty = False
+        self._last_flush = 0
+        self._cookies_state = None
+        self.stats = defaultdict(int)
+        self.request_avg_time = HTTPInterface.request_avg_time
+        self.persist_interval = HTTPInterface.persist_interval
+        self.limiter = None
+        self.archive = None
+        self.base_url = None
+        self.metrics = None
+        self._flights = _SingleFlight()
+        if data_dir is not None:
+            self.set_data_dir(data_dir)
+        if credentials is not None:
+            self.set_credentials(credentials)
+
 
 
 ############################################################
@@ -563,17 +1380,369 @@ def _clean_HTML(text):
 
 _unescape = HTMLParser().unescape
 
+def _fingerprint(data):
+    """
+    Return fingerprint of the webpage content ignoring volatile parts like hidden
+    inputs with viewstate.
+
+    """
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    data = _pcre("volatile_input", True).sub(b"", data)
+    data = _pcre("double_space", True).sub(b" ", data)
+    return sha1(data).hexdigest()
+
+def _write_atomic(filename, data):
+    """ Write data to file atomically (via temporary file and rename). """
+    fd, temp_name = tempfile.mkstemp(dir=os.path.dirname(filename), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as fp:
+            fp.write(data)
+        os.replace(temp_name, filename)
+    finally:
+        if os.path.exists(temp_name):
+            os.unlink(temp_name)
+
+_earth_radius = 6371.0
+_compass_points = ("N", "NE", "E", "SE", "S", "SW", "W", "NW")
+
+def _distances(lat, lon, points):
+    """
+    Compute distances (in km) and compass directions from (lat, lon) to a sequence
+    of points starting with (lat_rad, lon_rad, cos_lat) items.
+
+    """
+    lat = math.radians(lat)
+    lon = math.radians(lon)
+    cos_lat = math.cos(lat)
+    sin = math.sin
+    cos = math.cos
+    asin = math.asin
+    atan2 = math.atan2
+    degrees = math.degrees
+    result = []
+    for point in points:
+        lat2, lon2, cos_lat2 = point[0], point[1], point[2]
+        dlon = lon2 - lon
+        a = sin((lat2 - lat) / 2) ** 2 + cos_lat * cos_lat2 * sin(dlon / 2) ** 2
+        distance = 2 * _earth_radius * asin(min(1.0, math.sqrt(a)))
+        if distance == 0:
+            result.append((0.0, "Here"))
+            continue
+        bearing = degrees(atan2(sin(dlon) * cos_lat2, cos_lat * sin(lat2) - sin(lat) * cos_lat2 * cos(dlon)))
+        result.append((distance, _compass_points[int((bearing + 382.5) // 45) % 8]))
+    return result
+
 _pcres = {}
+_pcres_binary = {}
 _pcre_masks = {}
 
-def _pcre(name):
-    """ Return compiled PCRE. """
+def _pcre(name, binary=False):
+    """
+    Return compiled PCRE.
+
+    With binary set, return its variant for matching bytes-like data, that
+    decodes only the captured groups.  While a ParseProfiler is enabled, the
+    pattern is wrapped to record its statistics.
+
+    """
     if name not in _pcre_masks:
         logging.getLogger("gcparser.helpers").error("Uknown PCRE '{0}'.".format(name))
         name = "null"
-    if name not in _pcres:
-        _pcres[name] = re.compile(*_pcre_masks[name])
-    return _pcres[name]
+    if binary:
+        if name not in _pcres_binary:
+            pattern, flags = _pcre_masks[name]
+            _pcres_binary[name] = _BytesPattern(re.compile(pattern.encode("utf-8"), flags & ~re.U))
+        pattern = _pcres_binary[name]
+    else:
+        if name not in _pcres:
+            _pcres[name] = re.compile(*_pcre_masks[name])
+        pattern = _pcres[name]
+    if ParseProfiler.active is not None:
+        return ParseProfiler.active._wrap(name, binary, pattern)
+    return pattern
+
+def _decode(value):
+    """ Decode captured group of bytes-like data. """
+    if value is None:
+        return None
+    return str(value, "utf-8")
+
+
+class _BytesMatch:
+    """ Match over bytes-like data returning decoded groups. """
+
+    __slots__ = ("_match",)
+
+    def __init__(self, match):
+        self._match = match
+
+    def group(self, *indices):
+        if len(indices) > 1:
+            return tuple(_decode(value) for value in self._match.group(*indices))
+        return _decode(self._match.group(*indices))
+
+    def groups(self, default=None):
+        return tuple(default if value is None else _decode(value) for value in self._match.groups())
+
+    def start(self, group=0):
+        return self._match.start(group)
+
+    def end(self, group=0):
+        return self._match.end(group)
+
+    def span(self, group=0):
+        return self._match.span(group)
+
+
+class _BytesPattern:
+    """ Compiled bytes PCRE returning decoded groups, sub works on bytes. """
+
+    __slots__ = ("pattern",)
+
+    def __init__(self, pattern):
+        self.pattern = pattern
+
+    def search(self, data, *args):
+        match = self.pattern.search(data, *args)
+        if match is None:
+            return None
+        return _BytesMatch(match)
+
+    def match(self, data, *args):
+        match = self.pattern.match(data, *args)
+        if match is None:
+            return None
+        return _BytesMatch(match)
+
+    def finditer(self, data, *args):
+        for match in self.pattern.finditer(data, *args):
+            yield _BytesMatch(match)
+
+    def findall(self, data, *args):
+        result = []
+        for item in self.pattern.findall(data, *args):
+            if isinstance(item, tuple):
+                result.append(tuple(_decode(value) for value in item))
+            else:
+                result.append(_decode(item))
+        return result
+
+    def sub(self, repl, data, count=0):
+        return self.pattern.sub(repl, data, count)
+
+    def subn(self, repl, data, count=0):
+        return self.pattern.subn(repl, data, count)
+
+
+class _ProfiledPattern:
+    """ Compiled PCRE recording its statistics into ParseProfiler. """
+
+    __slots__ = ("name", "pattern", "_profiler")
+
+    def __init__(self, name, pattern, profiler):
+        self.name = name
+        self.pattern = pattern
+        self._profiler = profiler
+
+    def _call(self, method, data, *args):
+        start = perf_counter()
+        result = getattr(self.pattern, method)(data, *args)
+        self._profiler._add_pattern(self.name, perf_counter() - start, bool(result), len(data))
+        return result
+
+    def search(self, data, *args):
+        return self._call("search", data, *args)
+
+    def match(self, data, *args):
+        return self._call("match", data, *args)
+
+    def findall(self, data, *args):
+        return self._call("findall", data, *args)
+
+    def sub(self, repl, data, count=0):
+        start = perf_counter()
+        result, subs = self.pattern.subn(repl, data, count)
+        self._profiler._add_pattern(self.name, perf_counter() - start, subs > 0, len(data))
+        return result
+
+    def finditer(self, data, *args):
+        iterator = self.pattern.finditer(data, *args)
+        elapsed = 0
+        found = False
+        try:
+            while True:
+                start = perf_counter()
+                try:
+                    match = next(iterator)
+                finally:
+                    elapsed += perf_counter() - start
+                found = True
+                yield match
+        except StopIteration:
+            pass
+        finally:
+            self._profiler._add_pattern(self.name, elapsed, found, len(data))
+
+
+class _ProfiledRecord(dict):
+    """ Dictionary of parsed fields recording time spent on each field. """
+
+    def __init__(self, profiler, prefix):
+        dict.__init__(self)
+        self._profiler = profiler
+        self._prefix = prefix
+        self._last = perf_counter()
+
+    def __setitem__(self, key, value):
+        now = perf_counter()
+        dict.__setitem__(self, key, value)
+        size = len(value) if isinstance(value, (str, list, dict)) else 0
+        self._profiler._add_field("{0}.{1}".format(self._prefix, key), now - self._last, size)
+        self._last = perf_counter()
+
+
+def _record(prefix):
+    """ Return empty dictionary for parsed fields, profiled if enabled. """
+    if ParseProfiler.active is not None:
+        return _ProfiledRecord(ParseProfiler.active, prefix)
+    return {}
+
+
+def _detach(record):
+    """ Return parsed fields as plain dictionary not bound to the profiler. """
+    if isinstance(record, _ProfiledRecord):
+        return dict(record)
+    return record
+
+
+class ParseProfiler:
+    """
+    Collect call counts, time, match ratio and input sizes of regular
+    expressions, and time spent on each parsed field.
+
+    Attributes:
+        active      --- Currently enabled ParseProfiler, or None.
+        log_interval --- Interval in seconds of logging the report, or None.
+
+    Methods:
+        enable      --- Start profiling the parsers.
+        disable     --- Stop profiling the parsers.
+        reset       --- Clear the collected statistics.
+        snapshot    --- Return dictionary with the collected statistics.
+        report      --- Return text report of the most expensive patterns
+                        and fields.
+
+    """
+
+    active = None
+    _log = logging.getLogger("gcparser.profile")
+
+    def __init__(self, log_interval=None):
+        """
+        Keyworded arguments:
+            log_interval --- Interval in seconds of logging the report.
+
+        """
+        self.log_interval = log_interval
+        self._lock = threading.Lock()
+        self._wrapped = {}
+        self.reset()
+
+    def __enter__(self):
+        self.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.disable()
+
+    def enable(self):
+        """
+        Start profiling the parsers.
+
+        """
+        ParseProfiler.active = self
+
+    def disable(self):
+        """
+        Stop profiling the parsers.
+
+        """
+        if ParseProfiler.active is self:
+            ParseProfiler.active = None
+
+    def reset(self):
+        """
+        Clear the collected statistics.
+
+        """
+        with self._lock:
+            self._patterns = defaultdict(lambda: [0, 0.0, 0, 0])
+            self._fields = defaultdict(lambda: [0, 0.0, 0])
+            self._last_log = time()
+
+    def _wrap(self, name, binary, pattern):
+        key = (name, binary)
+        if key not in self._wrapped:
+            self._wrapped[key] = _ProfiledPattern(name, pattern, self)
+        return self._wrapped[key]
+
+    def _add_pattern(self, name, elapsed, matched, size):
+        with self._lock:
+            stats = self._patterns[name]
+            stats[0] += 1
+            stats[1] += elapsed
+            stats[2] += matched
+            stats[3] += size
+        self._maybe_log()
+
+    def _add_field(self, name, elapsed, size):
+        with self._lock:
+            stats = self._fields[name]
+            stats[0] += 1
+            stats[1] += elapsed
+            stats[2] += size
+
+    def _maybe_log(self):
+        if self.log_interval is None or time() < self._last_log + self.log_interval:
+            return
+        self._last_log = time()
+        self._log.info(self.report())
+
+    def snapshot(self):
+        """
+        Return dictionary with the collected statistics.
+
+        Keys 'patterns' (by PCRE name: calls, time, matches, misses, bytes) and
+        'fields' (by parser.field: calls, time, size).
+
+        """
+        with self._lock:
+            patterns = {}
+            for name, (calls, elapsed, matches, size) in self._patterns.items():
+                patterns[name] = {"calls":calls, "time":elapsed, "matches":matches, "misses":calls - matches, "bytes":size}
+            fields = {}
+            for name, (calls, elapsed, size) in self._fields.items():
+                fields[name] = {"calls":calls, "time":elapsed, "size":size}
+        return {"patterns":patterns, "fields":fields}
+
+    def report(self, limit=20):
+        """
+        Return text report of the most expensive patterns and fields.
+
+        Keyworded arguments:
+            limit       --- Maximal number of lines for patterns and fields.
+
+        """
+        snapshot = self.snapshot()
+        lines = ["{0:<28} {1:>8} {2:>10} {3:>7} {4:>10}".format("Pattern", "calls", "time ms", "match", "avg bytes")]
+        for name, stats in sorted(snapshot["patterns"].items(), key=lambda item: -item[1]["time"])[:limit]:
+            lines.append("{0:<28} {1:8d} {2:10.2f} {3:7.1%} {4:10.0f}".format(name, stats["calls"], stats["time"] * 1000, stats["matches"] / stats["calls"], stats["bytes"] / stats["calls"]))
+        lines.append("{0:<28} {1:>8} {2:>10} {3:>7} {4:>10}".format("Field", "calls", "time ms", "", "avg size"))
+        for name, stats in sorted(snapshot["fields"].items(), key=lambda item: -item[1]["time"])[:limit]:
+            lines.append("{0:<28} {1:8d} {2:10.2f} {3:>7} {4:10.0f}".format(name, stats["calls"], stats["time"] * 1000, "", stats["size"] / stats["calls"]))
+        return "\n".join(lines)
+
 
 ########################################
 # PCRE: System.                        #
@@ -597,6 +1766,11 @@ _pcre_masks["HTMLtag"] = ("<[^>]*>", re.I)
 _pcre_masks["blank_line"] = ("^\s+|\s+$|^\s*$\n", re.M)
 _pcre_masks["double_space"] = ("\s\s+", 0)
 
+########################################
+# PCRE: Fingerprint.                   #
+########################################
+_pcre_masks["volatile_input"] = ("<input type=[\"']hidden[\"'][^>]*>", re.I)
+
 
 
 ############################################################
@@ -619,14 +1793,21 @@ class BaseParser:
 
     Attributes:
         http        --- HTTP interface object.
+        store       --- CacheStore instance to save parsed data to, or None.
 
     """
 
     http = HTTPInterface
+    store = None
 
-    def __init__(self):
-        if hasattr(self, "_log"):
-            self._log.log_parser = lambda x: self._log.log(LOG_PARSER, x)
+    def __init__(self, session=None):
+        """
+        Keyworded arguments:
+            session     --- HTTPSession instance, defaults to HTTPInterface.
+
+        """
+        if session is not None:
+            self.http = session
 
 
 ########################################
@@ -716,6 +1897,13 @@ class CacheDetails(BaseParser):
 
     Attributes:
         logs        --- Whether to return complete list of logs by default.
+        fingerprints --- Whether to skip parsing of listings with unchanged
+                        content fingerprint.
+        changes     --- Dictionary with status of the last download for each
+                        requested id ('new', 'changed', or 'unchanged').
+        cache       --- ResultCache instance for memoization of results, or None.
+        fingerprint_cache_size --- Number of listings remembered for fingerprint
+                        comparison, when no store is set.
 
     Methods:
         get         --- Get cache details as dictionary by guid or waypoint.
@@ -725,84 +1913,160 @@ class CacheDetails(BaseParser):
     _url = "http://www.geocaching.com/seek/cache_details.aspx?decrypt=y"
 
     logs = False
+    fingerprints = False
+    cache = None
+    fingerprint_cache_size = 1000
+    # Shared by all instances, calls are keyed by session and store.
+    _flights = _SingleFlight()
 
-    def __init__(self):
+    def __init__(self, session=None):
         self._log = logging.getLogger("gcparser.parser.CacheDetails")
-        BaseParser.__init__(self)
+        BaseParser.__init__(self, session)
+        self.changes = {}
+        self._parsed = ResultCache(max_size=self.fingerprint_cache_size, ttl=7*86400)
 
-    def get(self, id_):
+    def get(self, id_, max_age=None):
         """
         Get cache details by guid or waypoint.
 
+        Concurrent calls for the same cache share one download and the returned
+        dictionary, also across CacheDetails instances with the same session and
+        store.
+
         Arguments:
             id_         --- Geocache waypoint or guid.
 
+        Keyworded arguments:
+            max_age     --- Return details from store instead of downloading them,
+                            if they are not older than max_age seconds.
+
         """
+        if self.cache is not None:
+            details = self.cache.get(id_)
+            if details is not None:
+                if self.http.metrics is not None:
+                    self.http.metrics.emit("cache_hit", source="memory", id=id_)
+                return details
+        return self._flights.do((self.http, self.store, id_, max_age), lambda: self._load(id_, max_age))
+
+    def _load(self, id_, max_age):
+        """ Get cache details and put them into cache. """
+        details = self._get(id_, max_age)
+        if self.cache is not None:
+            # PM only listings (without full details) and unparseable listings.
+            negative = "name" not in details or (details.get("PMonly") and "logs" not in details)
+            self.cache.put(details, negative=negative, ids=(id_,))
+        return details
+
+    def _get(self, id_, max_age):
+        """ Get cache details, see get. """
+        if self.store is not None and max_age is not None:
+            fetched = self.store.fetched(id_)
+            if fetched is not None and fetched + max_age >= time():
+                details = self.store.get_details(id_)
+                if details is not None:
+                    self._log.debug("Using stored details of '{0}'.".format(id_))
+                    if self.http.metrics is not None:
+                        self.http.metrics.emit("cache_hit", source="store", id=id_)
+                    return details
+
         if _pcre("guid").match(id_) is not None:
             type_ = "guid"
         else:
             type_ = "wp"
         url = self._url + "&{0}={1}".format(type_, id_)
-        data = self.http.request(url, auth=True)
+        data = self.http.request(url, auth=True, raw=True)
+
+        if self.fingerprints:
+            fingerprint = _fingerprint(data)
+            if self.store is not None:
+                previous = self.store.fingerprint(id_)
+            else:
+                parsed = self._parsed.get(id_)
+                previous = parsed["fingerprint"] if parsed is not None else None
+            if previous == fingerprint:
+                if self.store is not None:
+                    details = self.store.get_details(id_)
+                    self.store.touch(id_)
+                else:
+                    details = deepcopy(parsed["details"])
+                if details is not None:
+                    self._log.debug("Listing of '{0}' is unchanged.".format(id_))
+                    self.changes[id_] = "unchanged"
+                    if self.http.metrics is not None:
+                        self.http.metrics.emit("cache_hit", source="unchanged", id=id_)
+                    return details
+            if previous is None:
+                self.changes[id_] = "new"
+            else:
+                self.changes[id_] = "changed"
 
-        details = {}
+        trace = self._log.isEnabledFor(LOG_PARSER)
+        details = _record("CacheDetails")
         if type_ == "wp":
             details["waypoint"] = id_
         else:
             details["guid"] = id_
-            match = _pcre("waypoint").search(data)
+            match = _pcre("waypoint", True).search(data)
             if match is not None:
                 details["waypoint"] = match.group(0)
-                self._log.log_parser("waypoint = {0}".format(details["waypoint"]))
+                if trace:
+                    self._log.log(LOG_PARSER, "waypoint = %s", details["waypoint"])
             else:
                 self._log.error("Waypoint not found.")
 
-        match = _pcre("PMonly").search(data)
+        match = _pcre("PMonly", True).search(data)
         if match is not None:
             details["PMonly"] = True
             self._log.warn("PM only cache at '{0}'.".format(url))
 
             details["name"] = _unescape(match.group(1)).strip()
-            self._log.log_parser("name = {0}".format(details["name"]))
+            if trace:
+                self._log.log(LOG_PARSER, "name = %s", details["name"])
 
-            match = _pcre("PMowner").search(data)
+            match = _pcre("PMowner", True).search(data)
             if match is not None:
                 details["owner"] = _unescape(match.group(1)).strip()
-                self._log.log_parser("owner = {0}".format(details["owner"]))
+                if trace:
+                    self._log.log(LOG_PARSER, "owner = %s", details["owner"])
             else:
                 self._log.error("Could not parse cache owner.")
 
-            match = _pcre("PMsize").search(data)
+            match = _pcre("PMsize", True).search(data)
             if match is not None:
                 details["size"] = match.group(1).strip()
-                self._log.log_parser("size = {0}".format(details["size"]))
+                if trace:
+                    self._log.log(LOG_PARSER, "size = %s", details["size"])
             else:
                 self._log.error("Could not parse cache size.")
 
-            match = _pcre("PMdifficulty").search(data)
+            match = _pcre("PMdifficulty", True).search(data)
             if match is not None:
                 details["difficulty"] = float(match.group(1))
-                self._log.log_parser("difficulty = {0:.1f}".format(details["difficulty"]))
+                if trace:
+                    self._log.log(LOG_PARSER, "difficulty = %.1f", details["difficulty"])
             else:
                 self._log.error("Could not parse cache difficulty.")
 
-            match = _pcre("PMterrain").search(data)
+            match = _pcre("PMterrain", True).search(data)
             if match is not None:
                 details["terrain"] = float(match.group(1))
-                self._log.log_parser("terrain = {0:.1f}".format(details["terrain"]))
+                if trace:
+                    self._log.log(LOG_PARSER, "terrain = %.1f", details["terrain"])
             else:
                 self._log.error("Could not parse cache terrain.")
 
-            match = _pcre("PMcache_type").search(data)
+            match = _pcre("PMcache_type", True).search(data)
             if match is not None and match.group(1) in _cache_types:
                 details["type"] = _cache_types[match.group(1)]
-                self._log.log_parser("type = {0}".format(details["type"]))
+                if trace:
+                    self._log.log(LOG_PARSER, "type = %s", details["type"])
             else:
                 self._log.error("Type not found.")
         else:
-            details["PMonly"] = _pcre("cache_pm").search(data) is not None
+            details["PMonly"] = _pcre("cache_pm", True).search(data) is not None
 
-            match = _pcre("cache_details").search(data)
+            match = _pcre("cache_details", True).search(data)
             if match is not None:
                 details["name"] = _unescape(_unescape(match.group(1))).strip()
                 details["owner"] = _unescape(_unescape(match.group(2))).strip()
@@ -815,33 +2079,36 @@ class CacheDetails(BaseParser):
                 else:
                     details["province"] = ""
                 details["country"] = _unescape(match.group(15)).strip()
-                self._log.log_parser("name = {0}".format(details["name"]))
-                self._log.log_parser("owner = {0}".format(details["owner"]))
-                self._log.log_parser("hidden = {0}".format(details["hidden"]))
-                self._log.log_parser("size = {0}".format(details["size"]))
-                self._log.log_parser("difficulty = {0:.1f}".format(details["difficulty"]))
-                self._log.log_parser("terrain = {0:.1f}".format(details["terrain"]))
-                self._log.log_parser("country = {0}".format(details["country"]))
-                self._log.log_parser("province = {0}".format(details["province"]))
+                if trace:
+                    self._log.log(LOG_PARSER, "name = %s", details["name"])
+                    self._log.log(LOG_PARSER, "owner = %s", details["owner"])
+                    self._log.log(LOG_PARSER, "hidden = %s", details["hidden"])
+                    self._log.log(LOG_PARSER, "size = %s", details["size"])
+                    self._log.log(LOG_PARSER, "difficulty = %.1f", details["difficulty"])
+                    self._log.log(LOG_PARSER, "terrain = %.1f", details["terrain"])
+                    self._log.log(LOG_PARSER, "country = %s", details["country"])
+                    self._log.log(LOG_PARSER, "province = %s", details["province"])
             else:
                 self._log.error("Could not parse cache details.")
 
-            match = _pcre("cache_type").search(data)
+            match = _pcre("cache_type", True).search(data)
             if match is not None:
                 details["type"] = _unescape(match.group(2)).strip()
                 # GS weird changes bug
                 if details["type"] == "Unknown Cache":
                     details["type"] = "Mystery/Puzzle Cache"
-                self._log.log_parser("type = {0}".format(details["type"]))
+                if trace:
+                    self._log.log(LOG_PARSER, "type = %s", details["type"])
             else:
                 self._log.error("Type not found.")
 
-            match = _pcre("cache_owner_id").search(data)
+            match = _pcre("cache_owner_id", True).search(data)
             if match is not None:
                 details["owner_id"] = match.group(1)
                 details["guid"] = match.group(2)
-                self._log.log_parser("guid = {0}".format(details["guid"]))
-                self._log.log_parser("owner_id = {0}".format(details["owner_id"]))
+                if trace:
+                    self._log.log(LOG_PARSER, "guid = %s", details["guid"])
+                    self._log.log(LOG_PARSER, "owner_id = %s", details["owner_id"])
             else:
                 self._log.error("Owner id not found.")
                 if "guid" not in details:
@@ -849,22 +2116,24 @@ class CacheDetails(BaseParser):
 
             details["disabled"] = 0
             details["archived"] = 0
-            match = _pcre("disabled").search(data)
+            match = _pcre("disabled", True).search(data)
             if match is not None:
                 if match.group(1) == "has been archived":
                     details["archived"] = 1
                 details["disabled"] = 1
-                self._log.log_parser("archived = {0}".format(details["archived"]))
-                self._log.log_parser("disabled = {0}".format(details["disabled"]))
+                if trace:
+                    self._log.log(LOG_PARSER, "archived = %s", details["archived"])
+                    self._log.log(LOG_PARSER, "disabled = %s", details["disabled"])
 
-            match = _pcre("cache_favorites").search(data)
+            match = _pcre("cache_favorites", True).search(data)
             if match is not None:
                 details["favorites"] = int(match.group(1))
-                self._log.log_parser("favorites = {0}".format(details["favorites"]))
+                if trace:
+                    self._log.log(LOG_PARSER, "favorites = %s", details["favorites"])
             else:
                 self._log.error("Favorites count not found.")
 
-            match = _pcre("cache_coords").search(data)
+            match = _pcre("cache_coords", True).search(data)
             if match is not None:
                 details["lat"] = float(match.group(2)) + float(match.group(3))/60
                 if match.group(1) == "S":
@@ -872,37 +2141,41 @@ class CacheDetails(BaseParser):
                 details["lon"] = float(match.group(5)) + float(match.group(6))/60
                 if match.group(4) == "W":
                     details["lon"] = -details["lon"]
-                self._log.log_parser("lat = {0:.5f}".format(details["lat"]))
-                self._log.log_parser("lon = {0:.5f}".format(details["lon"]))
+                if trace:
+                    self._log.log(LOG_PARSER, "lat = %.5f", details["lat"])
+                    self._log.log(LOG_PARSER, "lon = %.5f", details["lon"])
             else:
                 self._log.error("Lat, lon not found.")
 
-            match = _pcre("cache_shortDesc").search(data)
+            match = _pcre("cache_shortDesc", True).search(data)
             if match is not None:
                 details["shortDescHTML"] = match.group(1)
                 details["shortDesc"] = _clean_HTML(match.group(1))
-                self._log.log_parser("shortDesc = {0}...".format(details["shortDesc"].replace("\n"," ")[0:50]))
+                if trace:
+                    self._log.log(LOG_PARSER, "shortDesc = %s...", details["shortDesc"].replace("\n"," ")[0:50])
             else:
                 details["shortDescHTML"] = ""
                 details["shortDesc"] = ""
 
-            match = _pcre("cache_longDesc").search(data)
+            match = _pcre("cache_longDesc", True).search(data)
             if match is not None:
                 details["longDescHTML"] = match.group(1)
                 details["longDesc"] = _clean_HTML(match.group(1))
-                self._log.log_parser("longDesc = {0}...".format(details["longDesc"].replace("\n"," ")[0:50]))
+                if trace:
+                    self._log.log(LOG_PARSER, "longDesc = %s...", details["longDesc"].replace("\n"," ")[0:50])
             else:
                 details["longDescHTML"] = ""
                 details["longDesc"] = ""
 
-            match = _pcre("cache_hint").search(data)
+            match = _pcre("cache_hint", True).search(data)
             if match is not None:
                 details["hint"] = _unescape(match.group(1).replace("<br>", "\n")).strip()
-                self._log.log_parser("hint = {0}...".format(details["hint"].replace("\n"," ")[0:50]))
+                if trace:
+                    self._log.log(LOG_PARSER, "hint = %s...", details["hint"].replace("\n"," ")[0:50])
             else:
                 details["hint"] = ""
 
-            match = _pcre("cache_attributes").search(data)
+            match = _pcre("cache_attributes", True).search(data)
             if match is not None:
                 details["attributes"] = []
                 for item in _pcre("cache_attributes_item").finditer(match.group(1)):
@@ -910,37 +2183,55 @@ class CacheDetails(BaseParser):
                     if attr != "blank":
                         details["attributes"].append(attr)
                 details["attributes"] = ", ".join(details["attributes"])
-                self._log.log_parser("attributes = {0}".format(details["attributes"]))
+                if trace:
+                    self._log.log(LOG_PARSER, "attributes = %s", details["attributes"])
             else:
                 details["attributes"] = ""
 
-            details["inventory"] = {}
-            match = _pcre("cache_inventory").search(data)
+            inventory = {}
+            match = _pcre("cache_inventory", True).search(data)
             if match is not None:
                 for part in match.group(1).split("</li>"):
                     match = _pcre("cache_inventory_item").search(part)
                     if match is not None:
-                        details["inventory"][match.group(1)] = _unescape(match.group(2)).strip()
-                self._log.log_parser("inventory = {0}".format(details["inventory"]))
+                        inventory[match.group(1)] = _unescape(match.group(2)).strip()
+                if trace:
+                    self._log.log(LOG_PARSER, "inventory = %s", inventory)
+            details["inventory"] = inventory
 
-            details["visits"] = {}
-            match = _pcre("cache_visits").search(data)
+            visits = {}
+            match = _pcre("cache_visits", True).search(data)
             if match is not None:
                 for part in match.group(1).split("&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;"):
                     match = _pcre("cache_log_count").search(part)
                     if match is not None:
-                        details["visits"][_unescape(match.group(1)).strip()] = int(match.group(2).replace(",", ""))
-                self._log.log_parser("visits = {0}".format(details["visits"]))
+                        visits[_unescape(match.group(1)).strip()] = int(match.group(2).replace(",", ""))
+                if trace:
+                    self._log.log(LOG_PARSER, "visits = %s", visits)
+            details["visits"] = visits
 
-            details["logs"] = []
-            match = _pcre("cache_logs").search(data)
+            logs = []
+            match = _pcre("cache_logs", True).search(data)
             if match is not None:
                 for row in json.loads(match.group(1))["data"]:
                     m, d, y = row["Visited"].split("/")
                     log_date = "{0:04d}-{1:02d}-{2:02d}".format(int(y), int(m), int(d))
-                    details["logs"].append(CacheLog(row["LogGuid"], row["LogType"], log_date, _unescape(row["UserName"]), row["AccountGuid"], _clean_HTML(row["LogText"])))
-                self._log.log_parser("Found {0} logs.".format(len(details["logs"])))
-
+                    logs.append(CacheLog(row["LogGuid"], row["LogType"], log_date, _unescape(row["UserName"]), row["AccountGuid"], _clean_HTML(row["LogText"])))
+                if trace:
+                    self._log.log(LOG_PARSER, "Found %s logs.", len(logs))
+            details["logs"] = logs
+
+        details = _detach(details)
+        if self.http.archive is not None and "waypoint" in details:
+            self.http.archive.put(data, (details["waypoint"],))
+        if self.fingerprints and self.store is None:
+            ids = [id_] + [details[key] for key in ("waypoint", "guid") if key in details]
+            self._parsed.put({"fingerprint":fingerprint, "details":deepcopy(details)}, ids=ids)
+        if self.store is not None:
+            if self.fingerprints:
+                self.store.put_details((dict(details, fingerprint=fingerprint),))
+            else:
+                self.store.put_details((details,))
         return details
 
 
@@ -988,9 +2279,9 @@ class MyGeocachingLogs(BaseParser):
 
     _url = "http://www.geocaching.com/my/logs.aspx?s=1"
 
-    def __init__(self):
+    def __init__(self, session=None):
         self._log = logging.getLogger("gcparser.parser.MyGeocachingLogs")
-        BaseParser.__init__(self)
+        BaseParser.__init__(self, session)
 
     def get(self, log_types=None):
         """
@@ -1000,24 +2291,27 @@ class MyGeocachingLogs(BaseParser):
             log_types       --- If not None return only logs of listed type.
 
         """
-        data = self.http.request(self._url, auth=True)
-        expected_count = len(_pcre("logs_visit").findall(data))
+        data = self.http.request(self._url, auth=True, raw=True)
+        expected_count = len(_pcre("logs_visit", True).findall(data))
         self._log.debug("Expecting {0} logs...".format(expected_count))
+        trace = self._log.isEnabledFor(LOG_PARSER)
         logs = []
-        for log in _pcre("logs_item").findall(data):
+        for log in _pcre("logs_item", True).findall(data):
             expected_count -= 1
 
             log_type = _unescape(log[0]).strip()
-            self._log.log_parser("type = {0}".format(log_type))
+            if trace:
+                self._log.log(LOG_PARSER, "type = %s", log_type)
             if log_types is not None and log_type not in log_types:
                 self._log.debug("Wrong log type, continuing...")
                 continue
             log_date = "{0:04d}-{1:02d}-{2:02d}".format(int(log[3]), int(log[1]), int(log[2]))
             log_id = log[20]
-            self._log.log_parser("date = {0}".format(log_date))
-            self._log.log_parser("luid = {0}".format(log_id))
+            if trace:
+                self._log.log(LOG_PARSER, "date = %s", log_date)
+                self._log.log(LOG_PARSER, "luid = %s", log_id)
 
-            cache = {}
+            cache = _record("MyGeocachingLogs")
             cache["type"] = _unescape(log[7]).strip()
             # GS weird changes bug
             if cache["type"] == "Unknown Cache":
@@ -1035,15 +2329,16 @@ class MyGeocachingLogs(BaseParser):
             cache["country"] = _unescape(log[18]).strip()
             cache["guid"] = log[10]
             cache["name"] = _unescape(_unescape(log[13])).strip()
-            self._log.log_parser("cache_name = {0}".format(cache["name"]))
-            self._log.log_parser("cache_type = {0}".format(cache["type"]))
-            self._log.log_parser("cache_guid = {0}".format(cache["guid"]))
-            self._log.log_parser("archived = {0}".format(cache["archived"]))
-            self._log.log_parser("disabled = {0}".format(cache["disabled"]))
-            self._log.log_parser("country = {0}".format(cache["country"]))
-            self._log.log_parser("province = {0}".format(cache["province"]))
-
-            logs.append(LogItem(log_id, log_type, log_date, cache))
+            if trace:
+                self._log.log(LOG_PARSER, "cache_name = %s", cache["name"])
+                self._log.log(LOG_PARSER, "cache_type = %s", cache["type"])
+                self._log.log(LOG_PARSER, "cache_guid = %s", cache["guid"])
+                self._log.log(LOG_PARSER, "archived = %s", cache["archived"])
+                self._log.log(LOG_PARSER, "disabled = %s", cache["disabled"])
+                self._log.log(LOG_PARSER, "country = %s", cache["country"])
+                self._log.log(LOG_PARSER, "province = %s", cache["province"])
+
+            logs.append(LogItem(log_id, log_type, log_date, _detach(cache)))
         if expected_count > 0:
             self._log.error("Seems like I missed {0} geocaching logs for some reason.".format(expected_count))
         logs.reverse()
@@ -1113,9 +2408,9 @@ class SeekCache(BaseParser):
 
     _url = "http://www.geocaching.com/seek/nearest.aspx?"
 
-    def __init__(self):
+    def __init__(self, session=None):
         self._log = logging.getLogger("gcparser.parser.SeekCache")
-        BaseParser.__init__(self)
+        BaseParser.__init__(self, session)
 
     def coord(self, lat, lon, dist):
         """
@@ -1168,8 +2463,10 @@ class SeekCache(BaseParser):
         return SeekResult(caches, count, url, post_data, self)
 
     def _get_page(self, url, post_data=None):
-        data = self.http.request(url, data=post_data)
+        data = self.http.request(url, data=post_data, raw=True)
         count, caches, post_data = self._process_page(data)
+        if self.store is not None:
+            self.store.put_seek(caches)
         return count, caches, post_data
 
     def _process_page(self, data):
@@ -1180,14 +2477,14 @@ class SeekCache(BaseParser):
 
     def _parse_post_data(self, data):
         post_data = {}
-        for hidden_input in _pcre("hidden_input").findall(data):
+        for hidden_input in _pcre("hidden_input", True).findall(data):
             post_data[hidden_input[0]] = hidden_input[1]
         post_data["__EVENTTARGET"] = "ctl00$ContentBody$pgrTop$ctl08"
         return post_data
 
     def _parse_count(self, data):
         """ Parse total count of found caches. """
-        match = _pcre("search_totals").search(data)
+        match = _pcre("search_totals", True).search(data)
         if match is not None:
             return int(match.group(1))
         else:
@@ -1196,16 +2493,17 @@ class SeekCache(BaseParser):
 
     def _parse_caches(self, data):
         caches = []
-        match = _pcre("seek_results").search(data)
+        trace = self._log.isEnabledFor(LOG_PARSER)
+        match = _pcre("seek_results", True).search(data)
         if match is not None:
             for data in _pcre("seek_row").findall(match.group(1)):
                 data = data.split("</td>")
-                cache = self._parse_cache_record(data)
+                cache = self._parse_cache_record(data, trace)
                 caches.append(cache)
         return caches
 
-    def _parse_cache_record(self, data):
-        cache = {}
+    def _parse_cache_record(self, data, trace=False):
+        cache = _record("SeekCache")
         match = _pcre("seek_cache").search(data[5])
         if match is not None:
             if match.group(1) is not None:
@@ -1224,13 +2522,14 @@ class SeekCache(BaseParser):
             else:
                 cache["province"] = ""
             cache["country"] = _unescape(match.group(8)).strip()
-            self._log.log_parser("name = {0}".format(cache["name"]))
-            self._log.log_parser("waypoint = {0}".format(cache["waypoint"]))
-            self._log.log_parser("owner = {0}".format(cache["owner"]))
-            self._log.log_parser("disabled = {0}".format(cache["disabled"]))
-            self._log.log_parser("archived = {0}".format(cache["archived"]))
-            self._log.log_parser("province = {0}".format(cache["province"]))
-            self._log.log_parser("country = {0}".format(cache["country"]))
+            if trace:
+                self._log.log(LOG_PARSER, "name = %s", cache["name"])
+                self._log.log(LOG_PARSER, "waypoint = %s", cache["waypoint"])
+                self._log.log(LOG_PARSER, "owner = %s", cache["owner"])
+                self._log.log(LOG_PARSER, "disabled = %s", cache["disabled"])
+                self._log.log(LOG_PARSER, "archived = %s", cache["archived"])
+                self._log.log(LOG_PARSER, "province = %s", cache["province"])
+                self._log.log(LOG_PARSER, "country = %s", cache["country"])
         else:
             self._log.critical("Could not parse cache details.")
 
@@ -1240,7 +2539,8 @@ class SeekCache(BaseParser):
             if cache["type"] == "Unknown Cache":
                 # GS weird changes bug
                 cache["type"] = "Mystery/Puzzle Cache"
-            self._log.log_parser("type = {0}".format(cache["type"]))
+            if trace:
+                self._log.log(LOG_PARSER, "type = %s", cache["type"])
         else:
             self._log.error("Could not parse cache type.")
 
@@ -1255,24 +2555,27 @@ class SeekCache(BaseParser):
                 cache["distance"] *= 0.0003048
             else:
                 self._log.debug("Invalid distance value.")
-            self._log.log_parser("direction = {0}".format(cache["direction"]))
-            self._log.log_parser("distance = {:.2f}".format(cache["distance"]))
+            if trace:
+                self._log.log(LOG_PARSER, "direction = %s", cache["direction"])
+                self._log.log(LOG_PARSER, "distance = %.2f", cache["distance"])
 
         match = _pcre("seek_dts").search(data[7])
         if match is not None:
             cache["difficulty"] = float(match.group(1))
             cache["terrain"] = float(match.group(2))
             cache["size"] = match.group(3)
-            self._log.log_parser("difficulty = {0:.1f}".format(cache["difficulty"]))
-            self._log.log_parser("terrain = {0:.1f}".format(cache["terrain"]))
-            self._log.log_parser("size = {0}".format(cache["size"]))
+            if trace:
+                self._log.log(LOG_PARSER, "difficulty = %.1f", cache["difficulty"])
+                self._log.log(LOG_PARSER, "terrain = %.1f", cache["terrain"])
+                self._log.log(LOG_PARSER, "size = %s", cache["size"])
         else:
             self._log.error("DTS not found.")
 
         match = _pcre("seek_date").match(data[8])
         if match is not None:
             cache["hidden"] = "{0:04d}-{1:02d}-{2:02d}".format(int(match.group(4))+2000, _months_abbr[match.group(3)], int(match.group(2)))
-            self._log.log_parser("hidden = {0}".format(cache["hidden"]))
+            if trace:
+                self._log.log(LOG_PARSER, "hidden = %s", cache["hidden"])
         else:
             self._log.error("Hidden date not found.")
 
@@ -1292,26 +2595,31 @@ class SeekCache(BaseParser):
                         found_date = found_date - timedelta(days=1)
                     cache["found"] = found_date.isoformat()
         if "found" in cache:
-            self._log.log_parser("found = {0}".format(cache["found"]))
+            if trace:
+                self._log.log(LOG_PARSER, "found = %s", cache["found"])
         else:
             cache["found"] = None
-            self._log.log_parser("Never found.")
+            if trace:
+                self._log.log(LOG_PARSER, "Never found.")
 
         cache["PMonly"] = _pcre("seek_PMonly").search(data[6]) is not None
         if cache["PMonly"]:
-            self._log.log_parser("PM only cache.")
+            if trace:
+                self._log.log(LOG_PARSER, "PM only cache.")
         cache["items"] = _pcre("seek_items").search(data[6]) is not None
         if cache["items"]:
-            self._log.log_parser("Cache has items inside.")
+            if trace:
+                self._log.log(LOG_PARSER, "Cache has items inside.")
 
         match = _pcre("seek_favorites").search(data[2])
         if match is not None:
             cache["favorites"] = int(match.group(1))
-            self._log.log_parser("favorites = {0:d}".format(cache["favorites"]))
+            if trace:
+                self._log.log(LOG_PARSER, "favorites = %d", cache["favorites"])
         else:
             cache["favorites"] = 0
             self._log.error("Favorites count not found.")
-        return cache
+        return _detach(cache)
 
 
 
@@ -1363,9 +2671,183 @@ class SeekResult(Sequence):
         return self._count
 
 
+_png_signature = b"\x89PNG\r\n\x1a\n"
+_png_channels = {0:1, 2:3, 3:1, 4:2, 6:4}
+
+def _png_unfilter(data, width, height, channels, depth):
+    """ Decode scanlines of PNG image, return list of unfiltered rows. """
+    bpp = max(1, channels * depth // 8)
+    stride = (width * channels * depth + 7) // 8
+    if len(data) < height * (stride + 1):
+        raise ValueError("Invalid image data.")
+    rows = []
+    prev = bytearray(stride)
+    pos = 0
+    for y in range(height):
+        filter_type = data[pos]
+        row = bytearray(data[pos+1:pos+1+stride])
+        pos += stride + 1
+        if filter_type == 0:
+            pass
+        elif filter_type == 1:
+            for i in range(bpp, stride):
+                row[i] = (row[i] + row[i-bpp]) & 0xFF
+        elif filter_type == 2:
+            row = bytearray([(a + b) & 0xFF for a, b in zip(row, prev)])
+        elif filter_type == 3:
+            for i in range(bpp):
+                row[i] = (row[i] + (prev[i] >> 1)) & 0xFF
+            for i in range(bpp, stride):
+                row[i] = (row[i] + ((row[i-bpp] + prev[i]) >> 1)) & 0xFF
+        elif filter_type == 4:
+            for i in range(stride):
+                if i >= bpp:
+                    a = row[i-bpp]
+                    c = prev[i-bpp]
+                else:
+                    a = 0
+                    c = 0
+                b = prev[i]
+                pa = abs(b - c)
+                pb = abs(a - c)
+                pc = abs(a + b - 2*c)
+                if pa <= pb and pa <= pc:
+                    pred = a
+                elif pb <= pc:
+                    pred = b
+                else:
+                    pred = c
+                row[i] = (row[i] + pred) & 0xFF
+        else:
+            raise ValueError("Invalid PNG filter type {0}.".format(filter_type))
+        rows.append(row)
+        prev = row
+    return rows
+
+_png_unpack_tables = {}
+
+def _png_samples(row, count, depth):
+    """ Return list of sample values in a row of unfiltered PNG data. """
+    if depth == 8:
+        return row[:count]
+    if depth == 16:
+        return [(row[i] << 8) | row[i+1] for i in range(0, 2 * count, 2)]
+    if depth not in _png_unpack_tables:
+        per_byte = 8 // depth
+        mask = (1 << depth) - 1
+        _png_unpack_tables[depth] = [tuple((value >> (8 - depth * (i + 1))) & mask for i in range(per_byte)) for value in range(256)]
+    table = _png_unpack_tables[depth]
+    samples = []
+    for value in row:
+        samples.extend(table[value])
+    return samples[:count]
+
+def _decode_png(data):
+    """
+    Decode PNG image, return tuple (width, height, RGBA8 bytearray).
+
+    Supports all non-interlaced images with color types and bit depths allowed by
+    PNG specification.
+
+    """
+    if data[:8] != _png_signature:
+        raise ValueError("Invalid image data.")
+    pos = 8
+    header = None
+    palette = None
+    transparency = None
+    idat = []
+    while pos + 8 <= len(data):
+        length = int.from_bytes(data[pos:pos+4], "big")
+        chunk_type = data[pos+4:pos+8]
+        chunk = data[pos+8:pos+8+length]
+        if len(chunk) != length or zlib.crc32(data[pos+4:pos+8+length]) != int.from_bytes(data[pos+8+length:pos+12+length], "big"):
+            raise ValueError("Invalid image data.")
+        pos += length + 12
+        if chunk_type == b"IHDR":
+            header = chunk
+        elif chunk_type == b"PLTE":
+            palette = chunk
+        elif chunk_type == b"tRNS":
+            transparency = chunk
+        elif chunk_type == b"IDAT":
+            idat.append(chunk)
+        elif chunk_type == b"IEND":
+            break
+    if header is None or len(header) != 13 or not idat:
+        raise ValueError("Invalid image data.")
+    width = int.from_bytes(header[0:4], "big")
+    height = int.from_bytes(header[4:8], "big")
+    depth, color_type, compression, filter_method, interlace = header[8:13]
+    if color_type not in _png_channels or compression != 0 or filter_method != 0:
+        raise ValueError("Invalid image data.")
+    if interlace != 0:
+        raise ValueError("Interlaced PNG images are not supported.")
+    channels = _png_channels[color_type]
+    rows = _png_unfilter(zlib.decompress(b"".join(idat)), width, height, channels, depth)
+
+    buffer = bytearray(width * height * 4)
+    if color_type == 3:
+        if palette is None:
+            raise ValueError("Missing palette.")
+        alpha = transparency or b""
+        table = []
+        for i in range(len(palette) // 3):
+            if i < len(alpha):
+                table.append(palette[3*i:3*i+3] + alpha[i:i+1])
+            else:
+                table.append(palette[3*i:3*i+3] + b"\xff")
+        table.extend([b"\x00\x00\x00\xff"] * (256 - len(table)))
+        for y, row in enumerate(rows):
+            buffer[y*width*4:(y+1)*width*4] = b"".join([table[i] for i in _png_samples(row, width, depth)])
+        return width, height, buffer
+
+    if depth == 16:
+        scale = None
+    else:
+        scale = 255 // ((1 << depth) - 1)
+    key = None
+    if transparency is not None and color_type in (0, 2):
+        key = tuple(int.from_bytes(transparency[i:i+2], "big") for i in range(0, len(transparency), 2))
+    opaque = b"\xff" * width
+    for y, row in enumerate(rows):
+        samples = _png_samples(row, width * channels, depth)
+        values = samples
+        if scale is None:
+            values = bytes([value >> 8 for value in samples])
+        elif scale != 1:
+            values = bytes([value * scale for value in samples])
+        else:
+            values = bytes(samples)
+        out = bytearray(width * 4)
+        if color_type == 0:
+            out[0::4] = values
+            out[1::4] = values
+            out[2::4] = values
+            out[3::4] = opaque
+        elif color_type == 4:
+            out[0::4] = values[0::2]
+            out[1::4] = values[0::2]
+            out[2::4] = values[0::2]
+            out[3::4] = values[1::2]
+        elif color_type == 2:
+            out[0::4] = values[0::3]
+            out[1::4] = values[1::3]
+            out[2::4] = values[2::3]
+            out[3::4] = opaque
+        else:
+            out[:] = values
+        if key is not None:
+            for x in range(width):
+                if tuple(samples[x*channels:(x+1)*channels]) == key:
+                    out[4*x+3] = 0
+        buffer[y*width*4:(y+1)*width*4] = out
+    return width, height, buffer
+
+
 class ImageDownloader(threading.Thread):
     """
-    Thread for downloading images.
+    Thread for downloading images, see ImageFetcher for pooled downloads.
 
     Attributes:
         data        --- Downloaded data.
@@ -1388,25 +2870,174 @@ class ImageDownloader(threading.Thread):
 
     def run(self):
         opener = self.http.build_opener()
-        self.data = self.http.download_url(opener, self.url)
         try:
+            self.data = self.http.download_url(opener, self.url)
             self.image = Image.from_data(self.data)
         except Exception as e:
             self.image = Image()
 
 
+class ImageFetcher:
+    """
+    Pool of threads downloading images with on-disk cache.
+
+    Concurrent requests for the same URL share one download.  Downloaded data are
+    stored in content-addressed cache in 'images' subdirectory of data directory.
+
+    Methods:
+        fetch       --- Return future of Image downloaded from URL.
+        shutdown    --- Wait for pending downloads and stop worker threads.
+
+    """
+
+    def __init__(self, http=None, max_workers=4, cache_dir=None, timeout=30, max_attempts=3):
+        """
+        Keyworded arguments:
+            http        --- HTTP interface object.
+            max_workers --- Maximum number of concurrent downloads.
+            cache_dir   --- Directory for cached images, defaults to 'images'
+                            subdirectory of data directory.
+            timeout     --- Socket timeout for downloads in seconds.
+            max_attempts --- Maximum number of download attempts.
+
+        """
+        self._log = logging.getLogger("gcparser.ImageFetcher")
+        if http is None:
+            http = HTTPInterface
+        self.http = http
+        self._policy = RetryPolicy(timeout=timeout, max_attempts=max_attempts)
+        if cache_dir is None and http.get_data_dir() is not None:
+            cache_dir = os.path.join(http.get_data_dir(), "images")
+        if cache_dir is not None:
+            cache_dir = os.path.expanduser(cache_dir)
+            for subdir in ("objects", "urls"):
+                os.makedirs(os.path.join(cache_dir, subdir), exist_ok=True)
+        self._cache_dir = cache_dir
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._lock = threading.Lock()
+        self._pending = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+
+    def fetch(self, url):
+        """
+        Return future of Image downloaded from URL.
+
+        Arguments:
+            url         --- URL of the image.
+
+        """
+        with self._lock:
+            future = self._pending.get(url)
+            if future is not None:
+                return future
+            future = self._executor.submit(self._fetch, url)
+            self._pending[url] = future
+        # Outside of the lock, the callback runs immediately if already done.
+        future.add_done_callback(lambda future: self._done(url, future))
+        return future
+
+    def _done(self, url, future):
+        with self._lock:
+            if self._pending.get(url) is future:
+                del self._pending[url]
+
+    def _url_file(self, url):
+        return os.path.join(self._cache_dir, "urls", md5(url.encode("utf-8")).hexdigest())
+
+    def _object_file(self, hash_):
+        return os.path.join(self._cache_dir, "objects", hash_)
+
+    def _fetch(self, url):
+        """ Load image from cache, or download it. """
+        data = self._load(url)
+        if data is None:
+            self._log.debug("Downloading image '{0}'.".format(url))
+            opener = self.http.build_opener()
+            data = self.http.download_url(opener, url, policy=self._policy)
+            self._save(url, data)
+        return Image.from_data(data)
+
+    def _load(self, url):
+        """ Return cached image data, or None. """
+        if self._cache_dir is None:
+            return None
+        try:
+            with open(self._url_file(url), "r", encoding="utf-8") as fp:
+                hash_ = fp.read().strip()
+            with open(self._object_file(hash_), "rb") as fp:
+                data = fp.read()
+        except IOError:
+            return None
+        if sha1(data).hexdigest() != hash_:
+            self._log.warn("Corrupted cached image '{0}'.".format(url))
+            return None
+        return data
+
+    def _save(self, url, data):
+        """ Store image data in cache. """
+        if self._cache_dir is None:
+            return
+        hash_ = sha1(data).hexdigest()
+        object_file = self._object_file(hash_)
+        if not os.path.isfile(object_file):
+            _write_atomic(object_file, data)
+        _write_atomic(self._url_file(url), hash_.encode("utf-8"))
+
+    def shutdown(self):
+        """
+        Wait for pending downloads and stop worker threads.
+
+        """
+        self._executor.shutdown(wait=True)
+
+
+def _transparent(px):
+    """ Default predicate of empty pixels. """
+    return px.a == 0
+
+_filled_table = bytes([0] + [1] * 255)
+
+def _runs(profile):
+    """ Return list of (start, end) tuples of runs of filled lines in occupancy profile. """
+    runs = []
+    end = 0
+    while True:
+        start = profile.find(1, end)
+        if start == -1:
+            return runs
+        end = profile.find(0, start)
+        if end == -1:
+            end = len(profile)
+        runs.append((start, end - 1))
+
+
 class Image:
     """
     Basic image manipulation.
 
+    Pixel data are stored in a flat RGBA8 buffer, images created by cut and
+    friends are views sharing the buffer of the original image.
+
     Attributes:
         RGBA        --- Namedtuple for representing RGBA colors.
         width       --- Width of the image.
         height      --- Height of the image.
-        pixels      --- pixel data as [[pixel1_1, pixel2_1], [pixel1_2, pixel2_2]].
+        stride      --- Number of bytes between starts of two consecutive rows.
+        offset      --- Offset of the first pixel in the buffer.
+        buffer      --- Memoryview of the RGBA8 pixel buffer.
+        pixels      --- pixel data as [[pixel1_1, pixel2_1], [pixel1_2, pixel2_2]]
+                        (built lazily).
 
     Methods:
         from_data   --- Create image instance from PNG data (classmethod).
+        from_buffer --- Create image instance from RGBA8 buffer (classmethod).
+        row         --- Return memoryview of RGBA8 data of one row.
+        tobytes     --- Return RGBA8 data of the image without padding.
         bitmask     --- Return tuple of strings (rows of the image) with each pixel
                         represented by a character as empty or filled.
         cut         --- Create a new Image instance from a part of the original image.
@@ -1417,6 +3048,7 @@ class Image:
         strip       --- Create a new Image instance without empty columns and rows on the sides.
         hsplit      --- Create a sequence of new Image instances from parts of the image
                         separated by empty columns.
+        components  --- Return list of connected components of filled pixels.
 
     """
 
@@ -1428,13 +3060,50 @@ class Image:
             pixels  --- Pixel data.
 
         """
-        if len(pixels) > 0:
-            self.height = len(pixels)
-            self.width = len(pixels[0])
+        height = len(pixels)
+        if height > 0:
+            width = len(pixels[0])
         else:
-            self.width = 0
-            self.height = 0
-        self.pixels = pixels
+            width = 0
+        buffer = bytearray(width * height * 4)
+        i = 0
+        for row in pixels:
+            for px in row:
+                buffer[i:i+4] = bytes(px)
+                i += 4
+        self._set_buffer(buffer, width, height, width * 4, 0)
+
+    def _set_buffer(self, buffer, width, height, stride, offset):
+        self.buffer = memoryview(buffer)
+        self.width = width
+        self.height = height
+        self.stride = stride
+        self.offset = offset
+        self._pixels = None
+        self._masks = {}
+
+    @classmethod
+    def from_buffer(cls, buffer, width, height, stride=None, offset=0):
+        """
+        Create image instance from RGBA8 buffer without copying the data.
+
+        Arguments:
+            buffer  --- Object supporting buffer protocol with RGBA8 pixel data.
+            width   --- Width of the image.
+            height  --- Height of the image.
+
+        Keyworded arguments:
+            stride  --- Number of bytes between starts of two consecutive rows.
+            offset  --- Offset of the first pixel in the buffer.
+
+        """
+        if stride is None:
+            stride = width * 4
+        if height > 0 and width > 0 and len(memoryview(buffer)) < offset + (height - 1) * stride + width * 4:
+            raise ValueError("Buffer too small for the image.")
+        image = cls.__new__(cls)
+        image._set_buffer(buffer, width, height, stride, offset)
+        return image
 
     @classmethod
     def from_data(cls, data):
@@ -1455,20 +3124,66 @@ class Image:
         if len(data) == 0:
             return cls()
 
-        reader = png.Reader(bytes=data).asRGBA8()
-        width = reader[0]
-        height = reader[1]
-        pixels = []
-        for rowData in reader[2]:
-            row = []
-            for i in range(0, len(rowData), 4):
-                row.append(cls.RGBA(rowData[i], rowData[i+1], rowData[i+2], rowData[i+3]))
-            pixels.append(row)
-        if len(pixels) != height or len(pixels[-1]) != width:
-            raise ValueError("Invalid image data.")
-        return cls(pixels)
+        width, height, buffer = _decode_png(data)
+        return cls.from_buffer(buffer, width, height)
 
-    def bitmask(self, empty=lambda x: x.a == 0, chars=" X"):
+    @property
+    def pixels(self):
+        if self._pixels is None:
+            RGBA = self.RGBA
+            pixels = []
+            for y in range(self.height):
+                row = self.row(y)
+                pixels.append([RGBA(*row[i:i+4]) for i in range(0, len(row), 4)])
+            self._pixels = pixels
+        return self._pixels
+
+    def row(self, y):
+        """
+        Return memoryview of RGBA8 data of one row.
+
+        Arguments:
+            y       --- Row coordinate.
+
+        """
+        start = self.offset + y * self.stride
+        return self.buffer[start:start + self.width * 4]
+
+    def tobytes(self):
+        """
+        Return RGBA8 data of the image without padding.
+
+        """
+        if self.stride == self.width * 4:
+            start = self.offset
+            return self.buffer[start:start + self.height * self.stride].tobytes()
+        return b"".join(self.row(y) for y in range(self.height))
+
+    def _mask(self, empty):
+        """
+        Return list of rows of the image as bytes with 0 for empty and 1 for filled
+        pixels, the mask is computed only once per predicate.
+
+        """
+        if empty in self._masks:
+            return self._masks[empty]
+        if empty is _transparent:
+            mask = [self.row(y)[3::4].tobytes().translate(_filled_table) for y in range(self.height)]
+        else:
+            mask = [bytes([0 if empty(px) else 1 for px in row]) for row in self.pixels]
+        self._masks[empty] = mask
+        return mask
+
+    def _profiles(self, empty):
+        """ Return occupancy profiles (rows, columns) as bytes with 0 for empty and 1 for filled lines. """
+        mask = self._mask(empty)
+        rows = bytes([1 in row for row in mask])
+        columns = 0
+        for row in mask:
+            columns |= int.from_bytes(row, "big")
+        return rows, columns.to_bytes(self.width, "big")
+
+    def bitmask(self, empty=_transparent, chars=" X"):
         """
         Return tuple of strings (rows of the image) with each pixel represented by
         a character as empty or filled.
@@ -1478,21 +3193,13 @@ class Image:
             chars       --- Sequence containing characters for empty and filled pixels.
 
         """
-        mask = []
-        for y in range(self.height):
-            row = ""
-            for x in range(self.width):
-                px = self.pixels[y][x]
-                if empty(px):
-                    row += chars[0]
-                else:
-                    row += chars[1]
-            mask.append(row)
-        return tuple(mask)
+        table = {0:chars[0], 1:chars[1]}
+        return tuple(row.decode("latin-1").translate(table) for row in self._mask(empty))
 
     def cut(self, left, top, right, bottom):
         """
-        Create a new Image instance from a part of the original image.
+        Create a new Image instance from a part of the original image, the new
+        instance shares pixel data with the original image.
 
         Arguments:
             left    --- Left border coordinate.
@@ -1501,15 +3208,19 @@ class Image:
             bottom  --- Bottom border coordinate.
 
         """
-        pixels = []
-        for y in range(max(top, 0), min(bottom+1, self.height)):
-            row = []
-            for x in range(max(left, 0), min(right+1, self.width)):
-                row.append(self.pixels[y][x])
-            pixels.append(row)
-        return type(self)(pixels)
-
-    def vstrip(self, empty=lambda x: x.a == 0):
+        left = max(left, 0)
+        top = max(top, 0)
+        width = max(0, min(right+1, self.width) - left)
+        height = max(0, min(bottom+1, self.height) - top)
+        if height == 0:
+            return type(self)()
+        image = type(self).from_buffer(self.buffer, width, height, self.stride, self.offset + top * self.stride + left * 4)
+        # Share already computed masks with the new image.
+        for empty, mask in self._masks.items():
+            image._masks[empty] = [row[left:left+width] for row in mask[top:top+height]]
+        return image
+
+    def vstrip(self, empty=_transparent):
         """
         Create a new Image instance without empty rows on top and bottom side.
 
@@ -1517,20 +3228,12 @@ class Image:
             empty       --- Function returning True, if the pixel is considered empty.
 
         """
-        top = self.height-1
-        bottom = 0
-        for y in range(self.height):
-            is_empty = True
-            for x in range(self.width):
-                if not empty(self.pixels[y][x]):
-                    is_empty = False
-                    break
-            if not is_empty:
-                top = min(y, top)
-                bottom = max(y, bottom)
-        return self.cut(0, top, self.width-1, bottom)
+        rows = self._profiles(empty)[0]
+        if 1 in rows:
+            return self.cut(0, rows.index(1), self.width-1, rows.rindex(1))
+        return self.cut(0, self.height-1, self.width-1, 0)
 
-    def hstrip(self, empty=lambda x: x.a == 0):
+    def hstrip(self, empty=_transparent):
         """
         Create a new Image instance without empty columns on left and right side.
 
@@ -1538,20 +3241,12 @@ class Image:
             empty       --- Function returning True, if the pixel is considered empty.
 
         """
-        left = self.width-1
-        right = 0
-        for x in range(self.width):
-            is_empty = True
-            for y in range(self.height):
-                if not empty(self.pixels[y][x]):
-                    is_empty = False
-                    break
-            if not is_empty:
-                left = min(x, left)
-                right = max(x, right)
-        return self.cut(left, 0, right, self.height-1)
+        columns = self._profiles(empty)[1]
+        if 1 in columns:
+            return self.cut(columns.index(1), 0, columns.rindex(1), self.height-1)
+        return self.cut(self.width-1, 0, 0, self.height-1)
 
-    def strip(self, empty=lambda x: x.a == 0):
+    def strip(self, empty=_transparent):
         """
         Create a new Image instance without empty columns and rows on the sides.
 
@@ -1559,9 +3254,12 @@ class Image:
             empty       --- Function returning True, if the pixel is considered empty.
 
         """
-        return self.vstrip(empty=empty).hstrip(empty=empty)
+        rows, columns = self._profiles(empty)
+        if 1 not in rows:
+            return self.vstrip(empty=empty).hstrip(empty=empty)
+        return self.cut(columns.index(1), rows.index(1), columns.rindex(1), rows.rindex(1))
 
-    def vsplit(self, empty=lambda x: x.a == 0):
+    def vsplit(self, empty=_transparent):
         """
         Create a sequence of new Image instances from parts of the image separated by
         empty rows.
@@ -1570,30 +3268,10 @@ class Image:
             empty       --- Function returning True, if the pixel is considered empty.
 
         """
-        parts = []
-        top = None
-        bottom = None
-        for y in range(self.height):
-            is_empty = True
-            for x in range(self.width):
-                if not empty(self.pixels[y][x]):
-                    is_empty = False
-                    break
-            if not is_empty:
-                if top is None:
-                    top = y
-                    bottom = y
-                else:
-                    bottom = y
-            elif top is not None:
-                parts.append(self.cut(0, top, self.width-1, bottom))
-                top = None
-                bottom = None
-        if top is not None:
-            parts.append(self.cut(0, top, self.width-1, bottom))
-        return parts
+        rows = self._profiles(empty)[0]
+        return [self.cut(0, top, self.width-1, bottom) for top, bottom in _runs(rows)]
 
-    def hsplit(self, empty=lambda x: x.a == 0):
+    def hsplit(self, empty=_transparent):
         """
         Create a sequence of new Image instances from parts of the image separated by
         empty columns.
@@ -1602,28 +3280,199 @@ class Image:
             empty       --- Function returning True, if the pixel is considered empty.
 
         """
-        parts = []
-        left = None
-        right = None
-        for x in range(self.width):
-            is_empty = True
-            for y in range(self.height):
-                if not empty(self.pixels[y][x]):
-                    is_empty = False
-                    break
-            if not is_empty:
-                if left is None:
-                    left = x
-                    right = x
+        columns = self._profiles(empty)[1]
+        return [self.cut(left, 0, right, self.height-1) for left, right in _runs(columns)]
+
+    def components(self, empty=_transparent, connectivity=8, hgap=None, vgap=None):
+        """
+        Return list of connected components of filled pixels as ImageComponent
+        instances sorted from left to right.
+
+        The image of the component is a view of its bounding box, so it may contain
+        pixels of other components.
+
+        Keyworded arguments:
+            empty       --- Function returning True, if the pixel is considered empty.
+            connectivity --- 4 or 8 connected neighbourhood.
+            hgap        --- Merge components with horizontal gap up to hgap pixels
+                            (and vertical gap up to vgap pixels).
+            vgap        --- Merge components with vertical gap up to vgap pixels
+                            (and horizontal gap up to hgap pixels).
+
+        """
+        if connectivity not in (4, 8):
+            raise ValueError("Connectivity must be 4 or 8.")
+        reach = 1 if connectivity == 8 else 0
+        parent = []
+        boxes = []
+
+        def find(label):
+            while parent[label] != label:
+                parent[label] = parent[parent[label]]
+                label = parent[label]
+            return label
+
+        previous = []
+        for y, row in enumerate(self._mask(empty)):
+            current = []
+            for start, end in _runs(row):
+                label = None
+                for prev_start, prev_end, prev_label in previous:
+                    if prev_end + reach < start or prev_start - reach > end:
+                        continue
+                    root = find(prev_label)
+                    if label is None:
+                        label = root
+                    elif root != label:
+                        parent[root] = label
+                        box = boxes[root]
+                        other = boxes[label]
+                        boxes[label] = [min(box[0], other[0]), min(box[1], other[1]), max(box[2], other[2]), max(box[3], other[3])]
+                if label is None:
+                    label = len(parent)
+                    parent.append(label)
+                    boxes.append([start, y, end, y])
                 else:
-                    right = x
-            elif left is not None:
-                parts.append(self.cut(left, 0, right, self.height-1))
-                left = None
-                right = None
-        if left is not None:
-            parts.append(self.cut(left, 0, right, self.height-1))
-        return parts
+                    box = boxes[label]
+                    boxes[label] = [min(box[0], start), box[1], max(box[2], end), y]
+                current.append((start, end, label))
+            previous = current
+
+        found = [boxes[label] for label in range(len(parent)) if parent[label] == label]
+        if hgap is not None or vgap is not None:
+            hgap = hgap or 0
+            vgap = vgap or 0
+            merged = True
+            while merged:
+                merged = False
+                for i in range(len(found)):
+                    for j in range(i+1, len(found)):
+                        a = found[i]
+                        b = found[j]
+                        if max(a[0], b[0]) - min(a[2], b[2]) - 1 <= hgap and max(a[1], b[1]) - min(a[3], b[3]) - 1 <= vgap:
+                            found[i] = [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])]
+                            del found[j]
+                            merged = True
+                            break
+                    if merged:
+                        break
+        found.sort(key=lambda box: (box[0], box[1]))
+        return [ImageComponent(left, top, right, bottom, self.cut(left, top, right, bottom)) for left, top, right, bottom in found]
+
+
+_bits_table = bytes.maketrans(b"\x00\x01", b"01")
+
+class GlyphRecognizer:
+    """
+    Recognize characters in images by their bitmasks.
+
+    Glyphs are indexed by their stripped bitmask packed into an integer, images
+    with unknown bitmask are matched to the nearest glyph by Hamming distance of
+    bitmasks resampled to common grid.  Results are memoized by image content.
+
+    Attributes:
+        grid        --- Size of the grid used for nearest glyph search.
+        max_distance --- Maximum Hamming distance for nearest glyph search.
+        empty       --- Function returning True, if the pixel is considered empty.
+
+    Methods:
+        train       --- Add labeled glyph image to the index.
+        recognize   --- Return label of the glyph image.
+        read        --- Return recognized text in the image.
+
+    """
+
+    def __init__(self, grid=12, max_distance=16, empty=_transparent):
+        """
+        Keyworded arguments:
+            grid        --- Size of the grid used for nearest glyph search.
+            max_distance --- Maximum Hamming distance for nearest glyph search.
+            empty       --- Function returning True, if the pixel is considered empty.
+
+        """
+        self._log = logging.getLogger("gcparser.GlyphRecognizer")
+        self.grid = grid
+        self.max_distance = max_distance
+        self.empty = empty
+        self._exact = {}
+        self._nearest = []
+        self._memo = {}
+
+    def _keys(self, image):
+        """ Return (exact, grid) keys of the image. """
+        mask = image.strip(self.empty)._mask(self.empty)
+        height = len(mask)
+        width = len(mask[0]) if height else 0
+        bits = b"".join(mask).translate(_bits_table)
+        exact = (width, height, int(bits, 2) if bits else 0)
+        grid = 0
+        if width and height:
+            for gy in range(self.grid):
+                row = mask[gy * height // self.grid]
+                for gx in range(self.grid):
+                    grid = (grid << 1) | row[gx * width // self.grid]
+        return exact, grid
+
+    def train(self, label, image):
+        """
+        Add labeled glyph image to the index.
+
+        Arguments:
+            label       --- Label of the glyph (e.g. character).
+            image       --- Image instance.
+
+        """
+        exact, grid = self._keys(image)
+        if exact in self._exact and self._exact[exact] != label:
+            self._log.warn("Glyph '{0}' has the same bitmask as '{1}'.".format(label, self._exact[exact]))
+        self._exact[exact] = label
+        self._nearest.append((grid, label))
+        self._memo.clear()
+
+    def recognize(self, image):
+        """
+        Return label of the glyph image, or None if it is not recognized.
+
+        Arguments:
+            image       --- Image instance.
+
+        """
+        content = (image.width, image.height, md5(image.tobytes()).digest())
+        if content in self._memo:
+            return self._memo[content]
+        exact, grid = self._keys(image)
+        label = self._exact.get(exact)
+        if label is None:
+            best = self.max_distance + 1
+            for other, other_label in self._nearest:
+                distance = bin(grid ^ other).count("1")
+                if distance < best:
+                    best = distance
+                    label = other_label
+            if label is None:
+                self._log.debug("Unknown glyph:\n{0}".format("\n".join(image.bitmask(self.empty))))
+        self._memo[content] = label
+        return label
+
+    def read(self, image, unknown="?", **kwargs):
+        """
+        Return recognized text in the image.
+
+        Arguments:
+            image       --- Image instance.
+
+        Keyworded arguments:
+            unknown     --- Character used for unrecognized glyphs.
+            Other keyworded arguments are passed to Image.components.
+
+        """
+        text = []
+        for component in image.components(self.empty, **kwargs):
+            label = self.recognize(component.image)
+            if label is None:
+                label = unknown
+            text.append(label)
+        return "".join(text)
 
 
 ########################################
@@ -1638,9 +3487,9 @@ class Profile(BaseParser):
 
     """
 
-    def __init__(self):
+    def __init__(self, session=None):
         self._log = logging.getLogger("gcparser.parser.Profile")
-        BaseParser.__init__(self)
+        BaseParser.__init__(self, session)
 
     def update(self, profile_data):
         """
@@ -1655,3 +3504,1247 @@ class Profile(BaseParser):
         post_data["ctl00$ContentBody$uxSave"] = "Save Changes"
         self.http.request("http://www.geocaching.com/account/editprofiledetails.aspx", auth=True, data=post_data)
 
+
+
+
+############################################################
+### Storage.                                             ###
+############################################################
+
+class CacheStore:
+    """
+    SQLite store for parsed cache details and seek records.
+
+    Attributes:
+        spatial     --- Type of the spatial index in use ('rtree', or 'grid').
+        grid_size   --- Size of the grid cell in degrees (grid index only).
+
+    Methods:
+        put_details --- Insert or update a batch of cache details.
+        put_seek    --- Insert or update a batch of seek records.
+        stream      --- Store cache details from an iterable in batches.
+        get_details --- Get stored cache details by guid or waypoint.
+        fetched     --- Get timestamp of the last download of cache details.
+        fingerprint --- Get content fingerprint of the stored cache details.
+        touch       --- Update timestamp of the last download of cache details.
+        activity    --- Get activity signals of all stored caches.
+        bbox        --- Get waypoints of caches inside bounding box.
+        near        --- Get waypoints of caches near the given point.
+        close       --- Close the database connection.
+
+    """
+
+    grid_size = 0.1
+
+    _columns = ("waypoint", "guid", "name", "owner", "type", "lat", "lon", "PMonly", "disabled", "archived", "fingerprint")
+
+    def __init__(self, filename):
+        """
+        Arguments:
+            filename    --- Path to the database file (use '~' as a link to user's
+                            home directory), or ':memory:'.
+
+        """
+        self._log = logging.getLogger("gcparser.store")
+        if filename != ":memory:":
+            filename = os.path.expanduser(filename)
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(filename, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._create_schema()
+
+    def _create_schema(self):
+        """ Create tables and indexes, if they don't exist yet. """
+        with self._lock, self._db:
+            self._db.execute("CREATE TABLE IF NOT EXISTS caches (id INTEGER PRIMARY KEY, waypoint TEXT NOT NULL UNIQUE, guid TEXT, name TEXT, owner TEXT, type TEXT, lat REAL, lon REAL, PMonly INTEGER, disabled INTEGER, archived INTEGER, fingerprint TEXT, found TEXT, fetched REAL, details TEXT)")
+            columns = [row[1] for row in self._db.execute("PRAGMA table_info(caches)")]
+            if "fingerprint" not in columns:
+                # Databases created before fingerprints were stored.
+                self._db.execute("ALTER TABLE caches ADD COLUMN fingerprint TEXT")
+            self._db.execute("CREATE INDEX IF NOT EXISTS caches_guid ON caches (guid)")
+            self._db.execute("CREATE TABLE IF NOT EXISTS logs (luid TEXT PRIMARY KEY, waypoint TEXT NOT NULL, type TEXT, date TEXT, user TEXT, user_id TEXT, text TEXT, position INTEGER)")
+            columns = [row[1] for row in self._db.execute("PRAGMA table_info(logs)")]
+            if "position" not in columns:
+                # Databases created before the order of logs on the page was stored.
+                self._db.execute("ALTER TABLE logs ADD COLUMN position INTEGER")
+            self._db.execute("CREATE INDEX IF NOT EXISTS logs_waypoint ON logs (waypoint, date)")
+            self._db.execute("CREATE TABLE IF NOT EXISTS inventory (waypoint TEXT NOT NULL, guid TEXT NOT NULL, name TEXT, PRIMARY KEY (waypoint, guid))")
+            self._db.execute("CREATE TABLE IF NOT EXISTS visits (waypoint TEXT NOT NULL, type TEXT NOT NULL, count INTEGER, PRIMARY KEY (waypoint, type))")
+            try:
+                self._db.execute("CREATE VIRTUAL TABLE IF NOT EXISTS caches_rtree USING rtree(id, min_lat, max_lat, min_lon, max_lon)")
+                self.spatial = "rtree"
+            except sqlite3.OperationalError:
+                self._log.debug("R*Tree module not available, using grid index.")
+                self._db.execute("CREATE TABLE IF NOT EXISTS caches_grid (id INTEGER PRIMARY KEY, cell_lat INTEGER, cell_lon INTEGER)")
+                self._db.execute("CREATE INDEX IF NOT EXISTS caches_grid_cell ON caches_grid (cell_lat, cell_lon)")
+                self.spatial = "grid"
+
+    def put_details(self, records):
+        """
+        Insert or update a batch of cache details.
+
+        Arguments:
+            records     --- Iterable of cache details as returned by CacheDetails.get.
+
+        """
+        records = [record for record in records if "waypoint" in record]
+        if not records:
+            return
+        now = time()
+        caches = []
+        logs = []
+        inventory = []
+        visits = []
+        spatial = []
+        for record in records:
+            waypoint = record["waypoint"]
+            data = dict(record)
+            data.pop("fingerprint", None)
+            if "logs" in data:
+                # Logs are kept in their own table.
+                data["logs"] = []
+            row = [record.get(column) for column in self._columns]
+            row.extend((now, json.dumps(data)))
+            caches.append(row)
+            for position, log in enumerate(record.get("logs", ())):
+                logs.append((log.luid, waypoint, log.type, log.date, log.user, log.user_id, log.text, position))
+            for guid, name in record.get("inventory", {}).items():
+                inventory.append((waypoint, guid, name))
+            for type_, count in record.get("visits", {}).items():
+                visits.append((waypoint, type_, count))
+            if record.get("lat") is not None and record.get("lon") is not None:
+                spatial.append((record["lat"], record["lon"], waypoint))
+        placeholders = ", ".join("?" * (len(self._columns) + 2))
+        updates = ", ".join("{0}=excluded.{0}".format(column) for column in self._columns[1:] + ("fetched", "details"))
+        waypoints = [(record["waypoint"],) for record in records]
+        # Logs of listings parsed with logs replace the stored ones.
+        logs_waypoints = [(record["waypoint"],) for record in records if "logs" in record]
+        with self._lock, self._db:
+            self._db.executemany("INSERT INTO caches ({0}, fetched, details) VALUES ({1}) ON CONFLICT(waypoint) DO UPDATE SET {2}".format(", ".join(self._columns), placeholders, updates), caches)
+            self._db.executemany("DELETE FROM logs WHERE waypoint = ?", logs_waypoints)
+            self._db.executemany("INSERT OR REPLACE INTO logs (luid, waypoint, type, date, user, user_id, text, position) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", logs)
+            self._db.executemany("DELETE FROM inventory WHERE waypoint = ?", waypoints)
+            self._db.executemany("INSERT OR REPLACE INTO inventory (waypoint, guid, name) VALUES (?, ?, ?)", inventory)
+            self._db.executemany("DELETE FROM visits WHERE waypoint = ?", waypoints)
+            self._db.executemany("INSERT OR REPLACE INTO visits (waypoint, type, count) VALUES (?, ?, ?)", visits)
+            if self.spatial == "rtree":
+                self._db.executemany("INSERT OR REPLACE INTO caches_rtree (id, min_lat, max_lat, min_lon, max_lon) SELECT id, ?1, ?1, ?2, ?2 FROM caches WHERE waypoint = ?3", spatial)
+            else:
+                spatial = [(int(lat // self.grid_size), int(lon // self.grid_size), waypoint) for lat, lon, waypoint in spatial]
+                self._db.executemany("INSERT OR REPLACE INTO caches_grid (id, cell_lat, cell_lon) SELECT id, ?1, ?2 FROM caches WHERE waypoint = ?3", spatial)
+        self._log.debug("Stored details of {0} caches.".format(len(records)))
+
+    def put_seek(self, records):
+        """
+        Insert or update a batch of seek records.
+
+        Arguments:
+            records     --- Iterable of cache records as returned by SeekCache.
+
+        """
+        caches = []
+        for record in records:
+            if "waypoint" not in record:
+                continue
+            caches.append((record["waypoint"], record.get("name"), record.get("owner"), record.get("type"), record.get("PMonly"), record.get("disabled"), record.get("archived"), record.get("found")))
+        if not caches:
+            return
+        with self._lock, self._db:
+            self._db.executemany("INSERT INTO caches (waypoint, name, owner, type, PMonly, disabled, archived, found) VALUES (?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT(waypoint) DO UPDATE SET name=excluded.name, owner=excluded.owner, type=excluded.type, PMonly=excluded.PMonly, disabled=excluded.disabled, archived=excluded.archived, found=excluded.found", caches)
+        self._log.debug("Stored {0} seek records.".format(len(caches)))
+
+    def stream(self, records, batch_size=100):
+        """
+        Store cache details from an iterable in batches, return number of stored
+        records.
+
+        Arguments:
+            records     --- Iterable of cache details, e.g. a generator calling
+                            CacheDetails.get.
+
+        Keyworded arguments:
+            batch_size  --- Number of records stored in one transaction.
+
+        """
+        count = 0
+        batch = []
+        for record in records:
+            batch.append(record)
+            if len(batch) >= batch_size:
+                self.put_details(batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            self.put_details(batch)
+            count += len(batch)
+        return count
+
+    def _find(self, id_):
+        """ Return (waypoint, fetched, details, fingerprint) row of the cache by guid or waypoint. """
+        if _pcre("guid").match(id_) is not None:
+            query = "SELECT waypoint, fetched, details, fingerprint FROM caches WHERE guid = ?"
+        else:
+            query = "SELECT waypoint, fetched, details, fingerprint FROM caches WHERE waypoint = ?"
+        with self._lock:
+            return self._db.execute(query, (id_,)).fetchone()
+
+    def get_details(self, id_):
+        """
+        Get stored cache details by guid or waypoint, or None if not stored.
+
+        Arguments:
+            id_         --- Geocache waypoint or guid.
+
+        """
+        row = self._find(id_)
+        if row is None or row[2] is None:
+            return None
+        details = json.loads(row[2])
+        if "logs" in details:
+            with self._lock:
+                logs = self._db.execute("SELECT luid, type, date, user, user_id, text FROM logs WHERE waypoint = ? ORDER BY position, date DESC, rowid", (row[0],)).fetchall()
+            details["logs"] = [CacheLog(*log) for log in logs]
+        return details
+
+    def fetched(self, id_):
+        """
+        Get timestamp of the last download of cache details, or None.
+
+        Arguments:
+            id_         --- Geocache waypoint or guid.
+
+        """
+        row = self._find(id_)
+        if row is None:
+            return None
+        return row[1]
+
+    def fingerprint(self, id_):
+        """
+        Get content fingerprint of the stored cache details, or None.
+
+        Arguments:
+            id_         --- Geocache waypoint or guid.
+
+        """
+        row = self._find(id_)
+        if row is None:
+            return None
+        return row[3]
+
+    def touch(self, id_, timestamp=None):
+        """
+        Update timestamp of the last download of cache details.
+
+        Arguments:
+            id_         --- Geocache waypoint or guid.
+
+        Keyworded arguments:
+            timestamp   --- Download timestamp, defaults to now.
+
+        """
+        if timestamp is None:
+            timestamp = time()
+        if _pcre("guid").match(id_) is not None:
+            query = "UPDATE caches SET fetched = ? WHERE guid = ?"
+        else:
+            query = "UPDATE caches SET fetched = ? WHERE waypoint = ?"
+        with self._lock, self._db:
+            self._db.execute(query, (timestamp, id_))
+
+    def activity(self):
+        """
+        Get activity signals of all stored caches as list of tuples (waypoint,
+        fetched, found, visits).
+
+        """
+        with self._lock:
+            visits = defaultdict(dict)
+            for waypoint, type_, count in self._db.execute("SELECT waypoint, type, count FROM visits"):
+                visits[waypoint][type_] = count
+            rows = self._db.execute("SELECT waypoint, fetched, found FROM caches").fetchall()
+        return [(waypoint, fetched, found, visits.get(waypoint, {})) for waypoint, fetched, found in rows]
+
+    def bbox(self, min_lat, min_lon, max_lat, max_lon):
+        """
+        Get waypoints of caches inside bounding box.
+
+        Arguments:
+            min_lat     --- Southern border.
+            min_lon     --- Western border.
+            max_lat     --- Northern border.
+            max_lon     --- Eastern border.
+
+        """
+        if self.spatial == "rtree":
+            query = "SELECT c.waypoint FROM caches_rtree r JOIN caches c ON c.id = r.id WHERE r.min_lat >= ? AND r.max_lat <= ? AND r.min_lon >= ? AND r.max_lon <= ?"
+            params = (min_lat, max_lat, min_lon, max_lon)
+        else:
+            query = "SELECT c.waypoint FROM caches_grid g JOIN caches c ON c.id = g.id WHERE g.cell_lat BETWEEN ? AND ? AND g.cell_lon BETWEEN ? AND ? AND c.lat BETWEEN ? AND ? AND c.lon BETWEEN ? AND ?"
+            params = (int(min_lat // self.grid_size), int(max_lat // self.grid_size), int(min_lon // self.grid_size), int(max_lon // self.grid_size), min_lat, max_lat, min_lon, max_lon)
+        with self._lock:
+            return [row[0] for row in self._db.execute(query, params)]
+
+    def near(self, lat, lon, dist):
+        """
+        Get waypoints of caches in the bounding box around the given point.
+
+        Arguments:
+            lat         --- Latitude of center.
+            lon         --- Longitude of center.
+            dist        --- Distance from center in km.
+
+        """
+        dlat = dist / 111.2
+        dlon = dist / max(111.2 * math.cos(math.radians(lat)), 0.001)
+        return self.bbox(lat - dlat, lon - dlon, lat + dlat, lon + dlon)
+
+    def close(self):
+        """
+        Close the database connection.
+
+        """
+        with self._lock:
+            self._db.close()
+
+
+
+class SpatialIndex:
+    """
+    In-memory grid index of caches for offline nearest queries.
+
+    Returned records have the same shape as records in SeekResult plus the
+    coordinates (lat, lon), and are sorted by distance.
+
+    Attributes:
+        cell_size   --- Size of the grid cell in degrees.
+
+    Methods:
+        add         --- Add cache details to the index.
+        extend      --- Add cache details from an iterable to the index.
+        remove      --- Remove cache from the index.
+        nearest     --- Return k nearest caches.
+        radius      --- Return caches within distance.
+
+    """
+
+    _seek_keys = ("archived", "disabled", "name", "owner", "waypoint", "province", "country", "type", "difficulty", "terrain", "size", "hidden", "found", "PMonly", "favorites")
+
+    def __init__(self, cell_size=0.05):
+        """
+        Keyworded arguments:
+            cell_size   --- Size of the grid cell in degrees.
+
+        """
+        self.cell_size = cell_size
+        self._cells = defaultdict(list)
+        self._entries = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _cell(self, lat, lon):
+        return int(lat // self.cell_size), int(lon // self.cell_size)
+
+    def add(self, details):
+        """
+        Add cache details to the index, details without coordinates are ignored.
+
+        Arguments:
+            details     --- Cache details as returned by CacheDetails.get.
+
+        """
+        if details.get("lat") is None or details.get("lon") is None or "waypoint" not in details:
+            return
+        self.remove(details["waypoint"])
+        record = {}
+        for key in self._seek_keys:
+            record[key] = details.get(key)
+        record["items"] = bool(details.get("inventory"))
+        record["lat"] = details["lat"]
+        record["lon"] = details["lon"]
+        lat = math.radians(details["lat"])
+        entry = (lat, math.radians(details["lon"]), math.cos(lat), record)
+        cell = self._cell(details["lat"], details["lon"])
+        self._cells[cell].append(entry)
+        self._entries[details["waypoint"]] = (cell, entry)
+
+    def extend(self, records):
+        """
+        Add cache details from an iterable to the index.
+
+        Arguments:
+            records     --- Iterable of cache details.
+
+        """
+        for details in records:
+            self.add(details)
+
+    def remove(self, waypoint):
+        """
+        Remove cache from the index.
+
+        Arguments:
+            waypoint    --- Geocache waypoint.
+
+        """
+        if waypoint not in self._entries:
+            return
+        cell, entry = self._entries.pop(waypoint)
+        self._cells[cell].remove(entry)
+        if not self._cells[cell]:
+            del self._cells[cell]
+
+    def _results(self, lat, lon, entries, limit=None, dist=None):
+        """ Compute distances to entries and return sorted seek records. """
+        found = []
+        for entry, (distance, direction) in zip(entries, _distances(lat, lon, entries)):
+            if dist is None or distance <= dist:
+                found.append((distance, direction, entry[3]))
+        found.sort(key=lambda item: item[0])
+        if limit is not None:
+            found = found[:limit]
+        results = []
+        for distance, direction, record in found:
+            record = dict(record)
+            record["distance"] = distance
+            record["direction"] = direction
+            results.append(record)
+        return results
+
+    def nearest(self, lat, lon, k=20):
+        """
+        Return k nearest caches.
+
+        Arguments:
+            lat         --- Latitude of center.
+            lon         --- Longitude of center.
+
+        Keyworded arguments:
+            k           --- Maximum number of returned caches.
+
+        """
+        if not self._cells or k <= 0:
+            return []
+        center_lat, center_lon = self._cell(lat, lon)
+        lats = [cell[0] for cell in self._cells]
+        lons = [cell[1] for cell in self._cells]
+        max_ring = max(abs(center_lat - min(lats)), abs(center_lat - max(lats)), abs(center_lon - min(lons)), abs(center_lon - max(lons)))
+        entries = []
+        for ring in range(max_ring + 1):
+            for cell_lat in range(center_lat - ring, center_lat + ring + 1):
+                if abs(cell_lat - center_lat) == ring:
+                    cell_lons = range(center_lon - ring, center_lon + ring + 1)
+                else:
+                    cell_lons = (center_lon - ring, center_lon + ring)
+                for cell_lon in cell_lons:
+                    entries.extend(self._cells.get((cell_lat, cell_lon), ()))
+            if len(entries) >= k:
+                # Caches outside of the scanned rings are at least this far away.
+                edge = min(90.0, abs(lat) + (ring + 1) * self.cell_size)
+                bound = ring * self.cell_size * math.pi * _earth_radius / 180 * math.cos(math.radians(edge))
+                results = self._results(lat, lon, entries, limit=k)
+                if results[-1]["distance"] <= bound:
+                    return results
+        return self._results(lat, lon, entries, limit=k)
+
+    def radius(self, lat, lon, dist):
+        """
+        Return caches within distance.
+
+        Arguments:
+            lat         --- Latitude of center.
+            lon         --- Longitude of center.
+            dist        --- Maximum distance from center in km.
+
+        """
+        dlat = math.degrees(dist / _earth_radius)
+        dlon = dlat / max(math.cos(math.radians(min(90.0, abs(lat) + dlat))), 1e-6)
+        min_lat, min_lon = self._cell(lat - dlat, lon - dlon)
+        max_lat, max_lon = self._cell(lat + dlat, lon + dlon)
+        entries = []
+        if (max_lat - min_lat + 1) * (max_lon - min_lon + 1) > len(self._cells):
+            for (cell_lat, cell_lon), cell in self._cells.items():
+                if min_lat <= cell_lat <= max_lat and min_lon <= cell_lon <= max_lon:
+                    entries.extend(cell)
+        else:
+            for cell_lat in range(min_lat, max_lat + 1):
+                for cell_lon in range(min_lon, max_lon + 1):
+                    entries.extend(self._cells.get((cell_lat, cell_lon), ()))
+        return self._results(lat, lon, entries, dist=dist)
+
+
+
+class ResultCache:
+    """
+    In-memory LRU cache of parsed results with expiration.
+
+    Cache details are accessible by both waypoint and guid.  Negative entries
+    (e.g. PM only or unparseable listings) have their own time to live.
+
+    Attributes:
+        max_size    --- Maximum number of keys in the cache.
+        ttl         --- Time to live of entries in seconds.
+        negative_ttl --- Time to live of negative entries in seconds.
+        hits        --- Number of cache hits.
+        misses      --- Number of cache misses.
+        evictions   --- Number of entries evicted because of size limit.
+        expirations --- Number of expired entries.
+
+    Methods:
+        get         --- Return cached details by guid or waypoint, or None.
+        put         --- Put details into the cache.
+        invalidate  --- Remove cached details.
+        clear       --- Remove all entries.
+        stats       --- Return dictionary with cache counters.
+
+    """
+
+    def __init__(self, max_size=1000, ttl=600, negative_ttl=86400):
+        """
+        Keyworded arguments:
+            max_size    --- Maximum number of keys in the cache.
+            ttl         --- Time to live of entries in seconds.
+            negative_ttl --- Time to live of negative entries in seconds.
+
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, id_):
+        """
+        Return cached details by guid or waypoint, or None.
+
+        Arguments:
+            id_         --- Geocache waypoint or guid.
+
+        """
+        with self._lock:
+            entry = self._entries.get(id_)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[0] < time():
+                del self._entries[id_]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(id_)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, details, negative=False, ids=()):
+        """
+        Put details into the cache.
+
+        Arguments:
+            details     --- Cache details as returned by CacheDetails.get.
+
+        Keyworded arguments:
+            negative    --- Whether this is a negative entry.
+            ids         --- Additional keys of the entry.
+
+        """
+        if negative:
+            expires = time() + self.negative_ttl
+        else:
+            expires = time() + self.ttl
+        entry = (expires, details)
+        keys = set(ids)
+        for key in ("waypoint", "guid"):
+            if details.get(key):
+                keys.add(details[key])
+        with self._lock:
+            for key in keys:
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, id_):
+        """
+        Remove cached details (under all their keys).
+
+        Arguments:
+            id_         --- Geocache waypoint or guid.
+
+        """
+        with self._lock:
+            entry = self._entries.pop(id_, None)
+            if entry is None:
+                return
+            for key in [key for key, other in self._entries.items() if other is entry]:
+                del self._entries[key]
+
+    def clear(self):
+        """
+        Remove all entries.
+
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """
+        Return dictionary with cache counters.
+
+        """
+        with self._lock:
+            return {"size":len(self._entries), "hits":self.hits, "misses":self.misses, "evictions":self.evictions, "expirations":self.expirations}
+
+
+class PageArchive:
+    """
+    Append-only archive of raw webpages with content deduplication.
+
+    Pages are compressed and appended to a single data file, each distinct
+    content is stored only once.  Keys (URLs, waypoints) are looked up in
+    sorted fixed-width index files via mmap, recent additions are kept in
+    journals and merged into the indexes by compact.
+
+    Attributes:
+        directory   --- Directory with the archive files.
+        compression --- Compression of new entries ('zlib', 'lzma' or None).
+        compact_threshold --- Number of journal records triggering compact.
+
+    Methods:
+        put         --- Archive page content under keys.
+        get         --- Return the latest page archived under key.
+        history     --- Return all versions of page archived under key.
+        object      --- Return page content by its sha1 digest.
+        compact     --- Merge journals into the sorted indexes.
+        close       --- Compact and close the archive files.
+
+    """
+
+    _log = logging.getLogger("gcparser.archive")
+
+    # Data file entry header: sha1, compression, length.
+    _entry = struct.Struct(">20sBI")
+    # Key index record: md5 of key, timestamp in ms, data offset.
+    _key = struct.Struct(">16sQQ")
+    # Object index record: sha1, data offset.
+    _object = struct.Struct(">20sQ")
+    _compressions = {None:0, "zlib":1, "lzma":2}
+
+    def __init__(self, directory, compression="zlib", compact_threshold=10000):
+        """
+        Arguments:
+            directory   --- Directory with the archive files, created if needed.
+
+        Keyworded arguments:
+            compression --- Compression of new entries ('zlib', 'lzma' or None).
+            compact_threshold --- Number of journal records triggering compact.
+
+        """
+        if compression not in self._compressions:
+            raise ValueError("Unknown compression '{0}'.".format(compression))
+        self.directory = os.path.expanduser(directory)
+        self.compression = compression
+        self.compact_threshold = compact_threshold
+        self._lock = threading.RLock()
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        self._data = open(self._path("pages.dat"), "a+b")
+        self._journals = {}
+        self._indexes = {}
+        self._pending_keys = defaultdict(list)
+        self._pending_objects = {}
+        for name, record in (("keys", self._key), ("objects", self._object)):
+            self._open_index(name)
+            items = self._read_journal(name, record)
+            for item in items:
+                if self._indexed(name, record, item):
+                    # Left over by compact interrupted before resetting the journal.
+                    continue
+                if name == "keys":
+                    self._pending_keys[item[0]].append((item[1], item[2]))
+                else:
+                    self._pending_objects[item[0]] = item[1]
+            self._journals[name] = open(self._path(name + ".log"), "ab")
+            # Drop a truncated last record so that new records stay aligned.
+            self._journals[name].truncate(len(items) * record.size)
+
+    def __len__(self):
+        """ Return number of distinct pages. """
+        with self._lock:
+            return len(self._indexes["objects"] or b"") // self._object.size + len(self._pending_objects)
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _open_index(self, name):
+        """ Memory-map sorted index file. """
+        filename = self._path(name + ".idx")
+        self._indexes[name] = None
+        if os.path.isfile(filename) and os.path.getsize(filename) > 0:
+            with open(filename, "rb") as fp:
+                self._indexes[name] = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _read_journal(self, name, record):
+        """ Return records of the journal, ignoring a truncated last one. """
+        filename = self._path(name + ".log")
+        if not os.path.isfile(filename):
+            return []
+        with open(filename, "rb") as fp:
+            data = fp.read()
+        count = len(data) // record.size
+        return [record.unpack_from(data, i * record.size) for i in range(count)]
+
+    def _find(self, name, record, prefix):
+        """ Return range of records in sorted index starting with prefix. """
+        index = self._indexes[name]
+        if index is None:
+            return 0, 0
+        size = record.size
+        count = len(index) // size
+        bounds = []
+        for upper in (False, True):
+            low, high = 0, count
+            while low < high:
+                middle = (low + high) // 2
+                key = index[middle*size:middle*size+len(prefix)]
+                if key < prefix or (upper and key == prefix):
+                    low = middle + 1
+                else:
+                    high = middle
+            bounds.append(low)
+        return bounds[0], bounds[1]
+
+    def _indexed(self, name, record, item):
+        """ Check if the record is already in the sorted index. """
+        packed = record.pack(*item)
+        start, end = self._find(name, record, item[0])
+        index = self._indexes[name]
+        return any(index[i*record.size:(i+1)*record.size] == packed for i in range(start, end))
+
+    def _lookup_object(self, digest):
+        """ Return data offset of the content with sha1 digest, or None. """
+        if digest in self._pending_objects:
+            return self._pending_objects[digest]
+        start, end = self._find("objects", self._object, digest)
+        if start == end:
+            return None
+        return self._object.unpack_from(self._indexes["objects"], start * self._object.size)[1]
+
+    def _lookup_key(self, key):
+        """ Return sorted list of (timestamp, offset) archived under key. """
+        digest = md5(key.encode("utf-8")).digest()
+        start, end = self._find("keys", self._key, digest)
+        index = self._indexes["keys"]
+        result = [self._key.unpack_from(index, i * self._key.size)[1:] for i in range(start, end)]
+        result.extend(self._pending_keys.get(digest, ()))
+        result.sort()
+        return result
+
+    def _read(self, offset):
+        """ Read and decompress data entry at offset. """
+        self._data.seek(offset)
+        digest, compression, length = self._entry.unpack(self._data.read(self._entry.size))
+        data = self._data.read(length)
+        if compression == 1:
+            data = zlib.decompress(data)
+        elif compression == 2:
+            data = lzma.decompress(data)
+        return data
+
+    def put(self, data, keys, timestamp=None):
+        """
+        Archive page content under keys, return its sha1 digest.
+
+        Arguments:
+            data        --- Raw page content (bytes).
+            keys        --- Iterable of keys (e.g. URL, waypoint).
+
+        Keyworded arguments:
+            timestamp   --- Time of download, defaults to now.
+
+        """
+        if timestamp is None:
+            timestamp = time()
+        digest = sha1(data).digest()
+        with self._lock:
+            offset = self._lookup_object(digest)
+            if offset is None:
+                if self.compression == "zlib":
+                    payload = zlib.compress(data, 9)
+                elif self.compression == "lzma":
+                    payload = lzma.compress(data)
+                else:
+                    payload = data
+                self._data.seek(0, os.SEEK_END)
+                offset = self._data.tell()
+                self._data.write(self._entry.pack(digest, self._compressions[self.compression], len(payload)) + payload)
+                self._data.flush()
+                self._pending_objects[digest] = offset
+                self._journals["objects"].write(self._object.pack(digest, offset))
+                self._journals["objects"].flush()
+            milliseconds = int(timestamp * 1000)
+            for key in keys:
+                key_digest = md5(key.encode("utf-8")).digest()
+                self._pending_keys[key_digest].append((milliseconds, offset))
+                self._journals["keys"].write(self._key.pack(key_digest, milliseconds, offset))
+            self._journals["keys"].flush()
+            if len(self._pending_objects) + sum(len(items) for items in self._pending_keys.values()) >= self.compact_threshold:
+                self.compact()
+        return digest.hex()
+
+    def get(self, key):
+        """
+        Return the latest page archived under key, or None.
+
+        Arguments:
+            key         --- URL, waypoint or other key used in put.
+
+        """
+        with self._lock:
+            entries = self._lookup_key(key)
+            if not entries:
+                return None
+            return self._read(entries[-1][1])
+
+    def history(self, key):
+        """
+        Return list of (timestamp, data) of all versions archived under key.
+
+        Arguments:
+            key         --- URL, waypoint or other key used in put.
+
+        """
+        with self._lock:
+            return [(timestamp / 1000, self._read(offset)) for timestamp, offset in self._lookup_key(key)]
+
+    def object(self, digest):
+        """
+        Return page content by its sha1 digest, or None.
+
+        Arguments:
+            digest      --- Hex sha1 digest as returned by put.
+
+        """
+        with self._lock:
+            offset = self._lookup_object(bytes.fromhex(digest))
+            if offset is None:
+                return None
+            return self._read(offset)
+
+    def compact(self):
+        """
+        Merge journals into the sorted indexes.
+
+        """
+        with self._lock:
+            pending = {}
+            pending["keys"] = sorted(self._key.pack(digest, timestamp, offset) for digest, items in self._pending_keys.items() for timestamp, offset in items)
+            pending["objects"] = sorted(self._object.pack(digest, offset) for digest, offset in self._pending_objects.items())
+            for name, record in (("keys", self._key), ("objects", self._object)):
+                if not pending[name]:
+                    continue
+                index = self._indexes[name]
+                if index is not None:
+                    size = record.size
+                    current = (index[i*size:(i+1)*size] for i in range(len(index) // size))
+                else:
+                    current = ()
+                fd, tmp_name = tempfile.mkstemp(dir=self.directory)
+                try:
+                    with os.fdopen(fd, "wb") as fp:
+                        previous = None
+                        for item in heapq.merge(current, pending[name]):
+                            # Skip records merged already by an interrupted compact.
+                            if item != previous:
+                                fp.write(item)
+                            previous = item
+                    if index is not None:
+                        index.close()
+                    os.replace(tmp_name, self._path(name + ".idx"))
+                finally:
+                    if os.path.isfile(tmp_name):
+                        os.remove(tmp_name)
+                self._open_index(name)
+                self._journals[name].truncate(0)
+            self._pending_keys.clear()
+            self._pending_objects.clear()
+            self._log.debug("Archive compacted, {0} pages.".format(len(self)))
+
+    def close(self):
+        """
+        Compact and close the archive files.
+
+        """
+        with self._lock:
+            self.compact()
+            for fp in self._journals.values():
+                fp.close()
+            for index in self._indexes.values():
+                if index is not None:
+                    index.close()
+            self._data.close()
+
+
+
+############################################################
+### Refresh scheduling.                                  ###
+############################################################
+
+class RefreshScheduler:
+    """
+    Plan refreshes of cache details within a daily request budget.
+
+    Caches are refreshed in order of priority computed from time since the last
+    download and activity signals (date of the last find, number of logs).
+
+    Attributes:
+        budget      --- Maximum number of pages with auth=True downloaded per day.
+
+    Methods:
+        add         --- Add cache to the schedule.
+        extend      --- Add caches to the schedule from an iterable of tuples.
+        priority    --- Compute refresh priority of a cache.
+        run         --- Refresh caches until the schedule or budget is exhausted.
+
+    """
+
+    def __init__(self, budget=500):
+        """
+        Keyworded arguments:
+            budget      --- Maximum number of pages with auth=True downloaded per day.
+
+        """
+        self._log = logging.getLogger("gcparser.scheduler")
+        self.budget = budget
+        self._heap = []
+        self._counter = 0
+
+    def __len__(self):
+        return len(self._heap)
+
+    def priority(self, fetched=None, found=None, visits=None, now=None):
+        """
+        Compute refresh priority of a cache, higher is more urgent.
+
+        Keyworded arguments:
+            fetched     --- Timestamp of the last download, None if never downloaded.
+            found       --- Date of the last find in ISO format (as in seek records).
+            visits      --- Dictionary with log counts (as in cache details).
+            now         --- Current timestamp.
+
+        """
+        if fetched is None:
+            return float("inf")
+        if now is None:
+            now = time()
+        staleness = max(0.0, now - fetched) / 86400
+        activity = 1.0
+        if visits:
+            activity += sum(visits.values()) / 100
+        if found:
+            year, month, day = found.split("-")
+            days = (date.fromtimestamp(now) - date(int(year), int(month), int(day))).days
+            activity += 10 / (1 + max(0, days))
+        return staleness * activity
+
+    def add(self, waypoint, fetched=None, found=None, visits=None):
+        """
+        Add cache to the schedule.
+
+        Arguments:
+            waypoint    --- Geocache waypoint or guid.
+
+        Keyworded arguments:
+            fetched     --- Timestamp of the last download, None if never downloaded.
+            found       --- Date of the last find in ISO format (as in seek records).
+            visits      --- Dictionary with log counts (as in cache details).
+
+        """
+        priority = self.priority(fetched, found, visits)
+        self._counter += 1
+        heapq.heappush(self._heap, (-priority, self._counter, waypoint))
+
+    def extend(self, records):
+        """
+        Add caches to the schedule from an iterable of tuples (waypoint, fetched,
+        found, visits), e.g. CacheStore.activity().
+
+        Arguments:
+            records     --- Iterable of tuples.
+
+        """
+        for record in records:
+            self.add(*record)
+
+    def run(self, parser, budget=None):
+        """
+        Refresh caches until the schedule or budget is exhausted, yield cache
+        details.
+
+        Arguments:
+            parser      --- CacheDetails instance.
+
+        Keyworded arguments:
+            budget      --- Override of the daily budget.
+
+        """
+        if budget is None:
+            budget = self.budget
+        while self._heap:
+            today = date.today().isoformat()
+            if parser.http.stats[today] >= budget:
+                self._log.info("Daily budget of {0} requests is used up, {1} caches left in schedule.".format(budget, len(self._heap)))
+                return
+            waypoint = heapq.heappop(self._heap)[2]
+            yield parser.get(waypoint)
+
+
+
+
+############################################################
+### Export.                                              ###
+############################################################
+
+class _StreamWriter(metaclass=ABCMeta):
+    """
+    Common parts of streaming writers, subclasses implement write.
+
+    """
+
+    _openers = {"gzip":gzip.open, "bz2":bz2.open, "xz":lzma.open}
+
+    def __init__(self, output, compression=None):
+        """
+        Arguments:
+            output      --- File name, or file-like object opened in binary mode.
+
+        Keyworded arguments:
+            compression --- Compress output on the fly ('gzip', 'bz2', 'xz').
+
+        """
+        if compression is not None and compression not in self._openers:
+            raise ValueError("Unknown compression '{0}'.".format(compression))
+        if isinstance(output, str):
+            output = os.path.expanduser(output)
+        elif compression is None:
+            self._fp = output
+            self._close = False
+            return
+        if compression is None:
+            self._fp = open(output, "wb")
+        else:
+            self._fp = self._openers[compression](output, "wb")
+        self._close = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _write(self, text):
+        self._fp.write(text.encode("utf-8"))
+
+    @abstractmethod
+    def write(self, record):
+        """
+        Write one record, return False if it was skipped.
+
+        Arguments:
+            record      --- Parsed record.
+
+        """
+
+    def write_all(self, records):
+        """
+        Write all records from an iterable, return number of written records.
+
+        Arguments:
+            records     --- Iterable of parsed records, e.g. SeekResult, or
+                            a generator calling CacheDetails.get.
+
+        """
+        count = 0
+        for record in records:
+            if self.write(record):
+                count += 1
+        return count
+
+    def close(self):
+        """
+        Finish the output and close the file.
+
+        """
+        if self._fp is None:
+            return
+        if self._close:
+            self._fp.close()
+        else:
+            self._fp.flush()
+        self._fp = None
+
+
+def _jsonable(value):
+    """ Convert named tuples in parsed record to dictionaries. """
+    if hasattr(value, "_asdict"):
+        return dict((key, _jsonable(item)) for key, item in value._asdict().items())
+    if isinstance(value, dict):
+        return dict((key, _jsonable(item)) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(item) for item in value]
+    return value
+
+
+class JSONLinesWriter(_StreamWriter):
+    """
+    Streaming writer of parsed records to JSON Lines file.
+
+    Methods:
+        write       --- Write one record.
+        write_all   --- Write all records from an iterable.
+        close       --- Finish the output and close the file.
+
+    """
+
+    def write(self, record):
+        """
+        Write one record.
+
+        Arguments:
+            record      --- Cache details, seek record, or LogItem.
+
+        """
+        self._write(json.dumps(_jsonable(record), ensure_ascii=False, sort_keys=True))
+        self._write("\n")
+        return True
+
+
+class GPXWriter(_StreamWriter):
+    """
+    Streaming writer of cache details to GPX file with Groundspeak extensions.
+
+    Any record with coordinates is written as a waypoint, including records
+    returned by SpatialIndex, missing fields are left empty.  Records from seek
+    queries on geocaching.com carry no coordinates: writing a record without
+    coordinates raises ValueError, unless skip_missing is set, in which case it
+    is skipped and counted.
+
+    Attributes:
+        skip_missing --- Skip records without coordinates instead of raising
+                        ValueError.
+        skipped     --- Number of skipped records.
+
+    Methods:
+        write       --- Write one record.
+        write_all   --- Write all records from an iterable.
+        close       --- Finish the output and close the file.
+
+    """
+
+    _url = "http://www.geocaching.com/seek/cache_details.aspx?wp="
+
+    def __init__(self, output, compression=None, name="gcparser export", skip_missing=False):
+        """
+        Arguments:
+            output      --- File name, or file-like object opened in binary mode.
+
+        Keyworded arguments:
+            compression --- Compress output on the fly ('gzip', 'bz2', 'xz').
+            name        --- Name of the GPX file.
+            skip_missing --- Skip records without coordinates instead of
+                            raising ValueError.
+
+        """
+        _StreamWriter.__init__(self, output, compression)
+        self._log = logging.getLogger("gcparser.export.GPXWriter")
+        self.skip_missing = skip_missing
+        self.skipped = 0
+        self._write("<?xml version=\"1.0\" encoding=\"utf-8\"?>\n")
+        self._write("<gpx xmlns:xsi=\"http://www.w3.org/2001/XMLSchema-instance\" xmlns:xsd=\"http://www.w3.org/2001/XMLSchema\" version=\"1.0\" creator=\"gcparser {0}\" xsi:schemaLocation=\"http://www.topografix.com/GPX/1/0 http://www.topografix.com/GPX/1/0/gpx.xsd http://www.groundspeak.com/cache/1/0/1 http://www.groundspeak.com/cache/1/0/1/cache.xsd\" xmlns=\"http://www.topografix.com/GPX/1/0\">\n".format(__version__))
+        self._write("<name>{0}</name>\n".format(escape(name)))
+        self._write("<time>{0}Z</time>\n".format(datetime.utcnow().replace(microsecond=0).isoformat()))
+
+    def write(self, record):
+        """
+        Write one record, return False if it was skipped.
+
+        Arguments:
+            record      --- Cache details or seek record with coordinates.
+
+        """
+        if record.get("lat") is None or record.get("lon") is None:
+            if not self.skip_missing:
+                raise ValueError("Record '{0}' has no coordinates, use CacheDetails.get to get them.".format(record.get("waypoint")))
+            self._log.debug("Skipping '{0}' without coordinates.".format(record.get("waypoint")))
+            self.skipped += 1
+            return False
+        # Seek records have missing fields set to None.
+        waypoint = record.get("waypoint") or ""
+        name = record.get("name") or ""
+        type_ = record.get("type") or ""
+        parts = []
+        parts.append("<wpt lat=\"{0:.6f}\" lon=\"{1:.6f}\">\n".format(record["lat"], record["lon"]))
+        if record.get("hidden"):
+            parts.append("  <time>{0}T00:00:00</time>\n".format(record["hidden"]))
+        parts.append("  <name>{0}</name>\n".format(escape(waypoint)))
+        parts.append("  <desc>{0}</desc>\n".format(escape("{0} by {1}, {2} ({3}/{4})".format(name, (record.get("owner") or ""), type_, (record.get("difficulty") or ""), (record.get("terrain") or "")))))
+        parts.append("  <url>{0}</url>\n".format(escape(self._url + waypoint)))
+        parts.append("  <urlname>{0}</urlname>\n".format(escape(name)))
+        parts.append("  <sym>Geocache</sym>\n")
+        parts.append("  <type>Geocache|{0}</type>\n".format(escape(type_)))
+        parts.append("  <groundspeak:cache id={0} available={1} archived={2} xmlns:groundspeak=\"http://www.groundspeak.com/cache/1/0/1\">\n".format(quoteattr(waypoint), quoteattr(str(not record.get("disabled"))), quoteattr(str(bool(record.get("archived"))))))
+        parts.append("    <groundspeak:name>{0}</groundspeak:name>\n".format(escape(name)))
+        parts.append("    <groundspeak:placed_by>{0}</groundspeak:placed_by>\n".format(escape((record.get("owner") or ""))))
+        parts.append("    <groundspeak:owner id={0}>{1}</groundspeak:owner>\n".format(quoteattr((record.get("owner_id") or "")), escape((record.get("owner") or ""))))
+        parts.append("    <groundspeak:type>{0}</groundspeak:type>\n".format(escape(type_)))
+        parts.append("    <groundspeak:container>{0}</groundspeak:container>\n".format(escape((record.get("size") or ""))))
+        if record.get("attributes"):
+            parts.append("    <groundspeak:attributes>\n")
+            for attribute in record["attributes"].split(", "):
+                parts.append("      <groundspeak:attribute id=\"0\" inc=\"1\">{0}</groundspeak:attribute>\n".format(escape(attribute)))
+            parts.append("    </groundspeak:attributes>\n")
+        parts.append("    <groundspeak:difficulty>{0}</groundspeak:difficulty>\n".format((record.get("difficulty") or "")))
+        parts.append("    <groundspeak:terrain>{0}</groundspeak:terrain>\n".format((record.get("terrain") or "")))
+        parts.append("    <groundspeak:country>{0}</groundspeak:country>\n".format(escape((record.get("country") or ""))))
+        parts.append("    <groundspeak:state>{0}</groundspeak:state>\n".format(escape((record.get("province") or ""))))
+        parts.append("    <groundspeak:short_description html=\"True\">{0}</groundspeak:short_description>\n".format(escape((record.get("shortDescHTML") or ""))))
+        parts.append("    <groundspeak:long_description html=\"True\">{0}</groundspeak:long_description>\n".format(escape((record.get("longDescHTML") or ""))))
+        parts.append("    <groundspeak:encoded_hints>{0}</groundspeak:encoded_hints>\n".format(escape((record.get("hint") or ""))))
+        parts.append("    <groundspeak:logs>\n")
+        for log in record.get("logs") or ():
+            parts.append("      <groundspeak:log id={0}>\n".format(quoteattr(log.luid)))
+            parts.append("        <groundspeak:date>{0}T00:00:00</groundspeak:date>\n".format(log.date))
+            parts.append("        <groundspeak:type>{0}</groundspeak:type>\n".format(escape(log.type)))
+            parts.append("        <groundspeak:finder id={0}>{1}</groundspeak:finder>\n".format(quoteattr(log.user_id), escape(log.user)))
+            parts.append("        <groundspeak:text encoded=\"False\">{0}</groundspeak:text>\n".format(escape(log.text)))
+            parts.append("      </groundspeak:log>\n")
+        parts.append("    </groundspeak:logs>\n")
+        parts.append("    <groundspeak:travelbugs>\n")
+        for guid, item in (record.get("inventory") or {}).items():
+            parts.append("      <groundspeak:travelbug id={0} ref=\"\">\n".format(quoteattr(guid)))
+            parts.append("        <groundspeak:name>{0}</groundspeak:name>\n".format(escape(item)))
+            parts.append("      </groundspeak:travelbug>\n")
+        parts.append("    </groundspeak:travelbugs>\n")
+        parts.append("  </groundspeak:cache>\n")
+        parts.append("</wpt>\n")
+        self._write("".join(parts))
+        return True
+
+    def close(self):
+        """
+        Finish the output and close the file.
+
+        """
+        if self._fp is not None:
+            self._write("</gpx>\n")
+        _StreamWriter.close(self)
+